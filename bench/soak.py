@@ -0,0 +1,100 @@
+"""Run stub tasks for many rounds, check own resources stay bounded
+
+One task file defines the tasks, half running System(['true']), half a
+python function. Each round runs all of them in parallel, like the
+scheduler under load, with a reload every RELOAD rounds. RSS, threads
+and fds are sampled after WARMUP rounds and at the end, the run fails
+when they grew more than RSS_SLACK, or at all for threads and fds.
+
+    PYTHONPATH=. python bench/soak.py [rounds] [tasks]
+    STATE_BACKEND=sqlite PYTHONPATH=. python bench/soak.py
+"""
+
+import typing as t
+import os
+import sys
+import gc
+import logging
+import tempfile
+import threading
+
+_dir = tempfile.mkdtemp(prefix='shine-soak-')
+for var in ('CONFIGURATION_DIRECTORY', 'STATE_DIRECTORY', 'RUNTIME_DIRECTORY'):
+    os.environ.setdefault(var, _dir)
+os.environ.setdefault('LOGS_DIRECTORY', os.path.join(_dir, 'log'))
+
+# pylint: disable=wrong-import-position
+from shine import daemon, logpipe, selfmon
+from shine.state import SqliteStore
+
+WARMUP = 5  # rounds before the first sample, caches and pools filled
+RELOAD = 5  # rounds between reloads
+RSS_SLACK = 16 << 20  # bytes, e.g. sqlite page cache filling as runs grow
+STUBS = '''
+next = Interval('1h')
+tasks = [
+    {{'name': f'sys{{i}}', 'run': Exit0(System(['true']))}} for i in range({half})
+] + [
+    {{'name': f'py{{i}}', 'run': lambda self: True}} for i in range({half})
+]
+'''
+
+
+def run_round() -> None:
+    threads = [
+        threading.Thread(target=x.thread, name=x.name)
+        for x in list(daemon.tasks.values())
+    ]
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+    for f in os.scandir(daemon.LOG_DIR):  # log rotation is out of scope
+        os.unlink(f.path)
+
+
+def main(argv: t.Sequence[str]) -> int:
+    rounds = int(argv[0]) if argv else 50
+    count = int(argv[1]) if argv[1:] else 200
+    os.makedirs(daemon.PLUGINS_DIR, exist_ok=True)
+    os.makedirs(daemon.TASKS_DIR, exist_ok=True)
+    with open(os.path.join(daemon.TASKS_DIR, 'stubs.py'), 'w', encoding='utf-8') as f:
+        f.write(STUBS.format(half=count // 2))
+    logpipe.setup(logging.WARNING)
+    if daemon.STATE_BACKEND == 'sqlite':
+        daemon.store = SqliteStore(daemon.STATE_DB)
+    if not daemon.reload():
+        print('failed loading stub tasks')
+        return 1
+    print(f'{len(daemon.tasks)} tasks, {daemon.STATE_BACKEND} state, in {_dir}')
+    first: t.Optional[selfmon.Sample] = None
+    for r in range(1, rounds + 1):
+        run_round()
+        if r % RELOAD == 0:
+            daemon.reload()
+        if r == WARMUP or r > WARMUP and (r == rounds or r % max(rounds // 10, 1) == 0):
+            gc.collect()
+            now = selfmon.sample()
+            first = first or now
+            print(
+                f'runs {r * len(daemon.tasks):7d} rss {now.rss / 2**20:6.1f}M '
+                f'threads {now.threads} fds {now.fds}',
+                flush=True,
+            )
+    last = selfmon.sample()
+    if first is None or rounds <= WARMUP:
+        print(f'too few rounds, need more than {WARMUP}')
+        return 1
+    grown = {key: getattr(last, key) - getattr(first, key) for key in selfmon.limits()}
+    limits = {'rss': RSS_SLACK, 'threads': 0, 'fds': 0}
+    over = {key: grown[key] for key in grown if grown[key] > limits[key]}
+    print(f'growth after warmup: {grown}')
+    if over:
+        print(f'over the limits {limits}: {over}')
+        return 1
+    print('bounded')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,26 +1,67 @@
+import typing as t
 import os
 import sys
+import json
 import atexit
 import socket
 import argparse
 import readline
 
 
-def execute(sock: socket.socket, command: str) -> None:
-    if not command:
-        return
-    sock.sendall((command + '\n').encode('utf-8'))
+def to_json(command: str) -> str:
+    """wrap a plain command line as a protocol v2 request"""
+    if not command or command.lstrip().startswith('{'):
+        return command
+    cmd, *args = command.split()
+    op: dict[str, t.Any] = {'cmd': cmd, 'arg': ' '.join(args)}
+    if args:
+        op['tasks'] = op['arg']  # split by the daemon, quotes and all
+    return json.dumps({'version': 2, 'ops': [op]})
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
     msg_len = int.from_bytes(sock.recv(4), 'big')
     msg = b''
     while len(msg) < msg_len:
-        msg += sock.recv(msg_len - len(msg))
-    print(msg.decode('utf-8', errors='ignore'))
+        chunk = sock.recv(msg_len - len(msg))
+        if not chunk:
+            raise BrokenPipeError()
+        msg += chunk
+    return msg
+
+
+def _stream(sock: socket.socket) -> None:
+    """print frames until an empty one, interrupt with ^C"""
+    try:
+        while chunk := _recv_frame(sock):
+            print(chunk.decode('utf-8', errors='ignore'), end='', flush=True)
+    except KeyboardInterrupt:
+        sock.sendall(b'\n')  # any input ends the stream
+        while _recv_frame(sock):
+            pass
+        raise
+
+
+def execute(sock: socket.socket, command: str, as_json: bool = False) -> None:
+    if as_json:
+        command = to_json(command)
+    if not command:
+        return
+    sock.sendall((command + '\n').encode('utf-8'))
+    msg = _recv_frame(sock)
+    if not msg:  # empty frame starts a stream
+        _stream(sock)
+    elif as_json:
+        print(json.dumps(json.loads(msg), indent=2))
+    else:
+        print(msg.decode('utf-8', errors='ignore'))
 
 
 def main() -> None:
     """simple control socket client"""
     parser = argparse.ArgumentParser(prog='shine', add_help=False)
     parser.add_argument('-s', '--socket')
+    parser.add_argument('-j', '--json', action='store_true')
     parser.add_argument('command', nargs='*')
     args = parser.parse_args()
     if args.socket:
@@ -53,13 +94,16 @@ def main() -> None:
         if args.command:
             line = ' '.join(args.command)
             readline.add_history(line)
-            execute(sock, line)
+            try:
+                execute(sock, line, args.json)
+            except KeyboardInterrupt:
+                pass
             return
 
         print('type "help" for usage', file=sys.stderr)
         while True:
             try:
-                execute(sock, input('> '))
+                execute(sock, input('> '), args.json)
             except KeyboardInterrupt:
                 print('^C', file=sys.stderr)  # newline
             except EOFError:
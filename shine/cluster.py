@@ -0,0 +1,307 @@
+import typing as t
+import logging as log
+import os
+import json
+import fcntl
+import sqlite3
+import threading
+from time import time
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+from .daemon import NODE_NAME, CLUSTER_LEASES, LEASE_TTL, LEASE_SKEW
+from .daemon import Task, tasks, lock, stopping, evt
+
+
+class Lease(t.NamedTuple):
+    node: str
+    expires: float
+    weight: float  # predicted load of the task, see predicted_load()
+
+
+def live(expires: float, now: float) -> bool:
+    """whether a lease of another host is still valid, allowing for clock skew"""
+    return expires + LEASE_SKEW > now
+
+
+class FileLeaseStore:
+    """one JSON file per lease and per node heartbeat in a (shared) directory,
+    claims serialized by flock"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> t.Iterator[None]:
+        with open(os.path.join(self.path, '.lock'), 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _file(self, key: str, suffix: str = '.lease') -> str:
+        return os.path.join(self.path, quote(key, safe='') + suffix)
+
+    @staticmethod
+    def _read(path: str) -> t.Optional[Lease]:
+        try:
+            with open(path, 'rb') as f:
+                return Lease(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, TypeError, ValueError):
+            log.warning(f'ignoring broken lease {path}')
+            return None
+
+    def claim(self, key: str, node: str, ttl: float, weight: float = 0.0) -> bool:
+        """take or renew the lease, unless held by another live node"""
+        path = self._file(key)
+        with self._locked():
+            current = self._read(path)
+            if current and current.node != node and live(current.expires, time()):
+                return False
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'node': node, 'expires': time() + ttl, 'weight': weight}, f)
+            os.replace(path + '.tmp', path)
+            return True
+
+    def release(self, key: str, node: str) -> None:
+        path = self._file(key)
+        with self._locked():
+            current = self._read(path)
+            if current and current.node == node:
+                os.unlink(path)
+
+    def heartbeat(self, node: str, ttl: float) -> None:
+        path = self._file(node, '.node')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'node': node, 'expires': time() + ttl, 'weight': 0.0}, f)
+        os.replace(path + '.tmp', path)
+
+    def release_node(self, node: str) -> None:
+        try:
+            os.unlink(self._file(node, '.node'))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self, suffix: str) -> dict[str, Lease]:
+        res = {}
+        for file in os.scandir(self.path):
+            if file.name.endswith(suffix):
+                lease = self._read(file.path)
+                if lease:
+                    res[unquote(file.name[: -len(suffix)])] = lease
+        return res
+
+    def leases(self) -> dict[str, Lease]:
+        return self._scan('.lease')
+
+    def nodes(self) -> dict[str, float]:
+        """node -> expiry of its heartbeat"""
+        return {k: v.expires for k, v in self._scan('.node').items()}
+
+
+class SqliteLeaseStore:
+    """leases in a SQLite file shared by daemons on the same host"""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                node TEXT NOT NULL,
+                expires REAL NOT NULL,
+                weight REAL NOT NULL
+            )''')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS nodes (
+                node TEXT PRIMARY KEY,
+                expires REAL NOT NULL
+            )''')
+
+    def claim(self, key: str, node: str, ttl: float, weight: float = 0.0) -> bool:
+        """take or renew the lease, unless held by another live node"""
+        now = time()
+        with self._lock:
+            cursor = self._db.execute(
+                '''INSERT INTO leases VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE
+                SET node = excluded.node, expires = excluded.expires,
+                    weight = excluded.weight
+                WHERE leases.node = excluded.node OR leases.expires <= ?''',
+                (key, node, now + ttl, weight, now - LEASE_SKEW),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, key: str, node: str) -> None:
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM leases WHERE key = ? AND node = ?', (key, node)
+            )
+
+    def heartbeat(self, node: str, ttl: float) -> None:
+        with self._lock:
+            self._db.execute('REPLACE INTO nodes VALUES (?, ?)', (node, time() + ttl))
+
+    def release_node(self, node: str) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM nodes WHERE node = ?', (node,))
+
+    def leases(self) -> dict[str, Lease]:
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM leases').fetchall()
+        return {key: Lease(*lease) for key, *lease in rows}
+
+    def nodes(self) -> dict[str, float]:
+        """node -> expiry of its heartbeat"""
+        with self._lock:
+            return dict(self._db.execute('SELECT * FROM nodes').fetchall())
+
+
+LeaseStore = t.Union[FileLeaseStore, SqliteLeaseStore]
+
+# task name -> owner node, as of the last balancing round
+owners: dict[str, str] = {}
+valid_until = 0.0  # pylint: disable=invalid-name  # own leases, less skew
+_store: t.Optional[LeaseStore] = None  # pylint: disable=invalid-name
+
+
+def owns(name: str) -> bool:
+    """whether this node may start the task, not after own leases may expire"""
+    if not CLUSTER_LEASES:
+        return True
+    return owners.get(name) == NODE_NAME and time() < valid_until
+
+
+def predicted_load(task: Task) -> float:
+    """share of time the task is expected to be running, from its last run"""
+    duration = task.last_finish - task.last_start
+    if task.last_start <= 0 or duration <= 0:
+        return 0.1  # never run, or still running for the first time
+    period = max(task.next_sched - task.last_start, duration)
+    return duration / period
+
+
+def _publish(owned: dict[str, str], handover: dict[str, str]) -> None:
+    """replace owners, keeping tasks to hand over that started meanwhile,
+    and stop running tasks of leases lost to other nodes"""
+    with lock:
+        for name in list(handover):
+            task = tasks.get(name)
+            if task and task.active:  # started meanwhile, keep it
+                del handover[name]
+                owned[name] = NODE_NAME
+        for name, node in owners.items():
+            task = tasks.get(name)
+            if node != NODE_NAME or owned.get(name) == NODE_NAME or not task:
+                continue
+            if task.active and name not in handover:
+                log.error(f'lost lease of running task {name}, stopping it')
+                task.kill()
+        changed = owners != owned
+        owners.clear()
+        owners.update(owned)
+        if changed:
+            evt('cluster:owners', owned)
+
+
+def balance(store: LeaseStore) -> None:
+    """renew own leases, claim free or expired ones, hand over excess load
+
+    Every node greedily claims free tasks while it is the least loaded
+    live node, and releases idle tasks while that strictly reduces the
+    difference to the least loaded one, so load converges without
+    tasks moving back and forth. The (shared) store is only accessed
+    without the daemon lock, which is held just to read tasks and to
+    publish owners.
+    """
+    # pylint: disable=too-many-locals
+    global valid_until  # pylint: disable=global-statement,invalid-name
+    started = time()
+    store.heartbeat(NODE_NAME, LEASE_TTL)
+    now = time()
+    load = {k: 0.0 for k, v in store.nodes().items() if live(v, now)}
+    load[NODE_NAME] = 0.0
+    leases = store.leases()
+    current = {k: v for k, v in leases.items() if live(v.expires, now)}
+    for lease in current.values():
+        if lease.node in load:
+            load[lease.node] += lease.weight
+
+    def least_loaded() -> str:
+        return min(load, key=lambda x: (load[x], x))
+
+    with lock:
+        weights = {name: predicted_load(task) for name, task in tasks.items()}
+        active = {name for name, task in tasks.items() if task.active}
+    mine = set()
+    # expired own leases too, a task may still run here
+    for name, lease in leases.items():
+        if lease.node == NODE_NAME and name in weights:
+            if store.claim(name, NODE_NAME, LEASE_TTL, weights[name]):
+                if name in current:
+                    load[NODE_NAME] += weights[name] - lease.weight
+                else:
+                    load[NODE_NAME] += weights[name]
+                mine.add(name)
+    free = [x for x in weights if x not in current and x not in mine]
+    for name in sorted(free, key=lambda x: -weights[x]):
+        if least_loaded() == NODE_NAME and store.claim(
+            name, NODE_NAME, LEASE_TTL, weights[name]
+        ):
+            log.info(f'claimed {name}')
+            load[NODE_NAME] += weights[name]
+            mine.add(name)
+    handover = {}
+    for name in sorted(mine, key=lambda x: -weights[x]):
+        target = least_loaded()
+        weight = weights[name]
+        if name in active or load[NODE_NAME] - weight < load[target] + weight:
+            continue
+        handover[name] = target
+        load[NODE_NAME] -= weight
+        load[target] += weight
+        mine.remove(name)
+    owned = {
+        k: v.node for k, v in current.items() if k in weights and v.node != NODE_NAME
+    }
+    owned.update({name: NODE_NAME for name in mine})
+    _publish(owned, handover)
+    valid_until = started + LEASE_TTL - LEASE_SKEW
+    for name, target in handover.items():  # not started here any more
+        log.info(f'handing over {name} to {target}')
+        store.release(name, NODE_NAME)
+    log.debug(f'load {load}')
+
+
+def release_all() -> None:
+    """give up all leases, so other nodes take over without waiting"""
+    if _store is None:
+        return
+    try:
+        for name in [k for k, v in owners.items() if v == NODE_NAME]:
+            _store.release(name, NODE_NAME)
+        _store.release_node(NODE_NAME)
+    except (OSError, sqlite3.Error):
+        log.exception('failed releasing leases')
+
+
+def cluster() -> None:
+    global _store  # pylint: disable=global-statement,invalid-name
+    try:
+        if CLUSTER_LEASES.endswith('.db'):
+            _store = SqliteLeaseStore(CLUSTER_LEASES)
+        else:
+            _store = FileLeaseStore(CLUSTER_LEASES)
+    except (OSError, sqlite3.Error):
+        log.critical(f'failed opening lease store {CLUSTER_LEASES}!')
+        return
+    log.warning(f'joined cluster as {NODE_NAME}')
+    while not stopping.is_set():
+        try:
+            balance(_store)
+        except (OSError, sqlite3.Error):
+            log.exception('failed renewing leases')
+        stopping.wait(LEASE_TTL / 3)
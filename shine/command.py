@@ -1,23 +1,57 @@
 import typing as t
 import logging as log
 import os
+import re
+import json
+import queue
+import shlex
+import codecs
 import signal
 import socket
 import threading
-from time import time
+from time import time, sleep, strftime, localtime
+from contextlib import contextmanager
 from types import MethodType
+from fnmatch import fnmatchcase
 
 from . import VERSION
 from . import daemon
-from .daemon import COMM_SOCK, Task, tasks, save, lock
+from .daemon import COMM_SOCK, NODE_NAME, CLUSTER_LEASES, SCHED_POLICY
+from .daemon import TRACE_SPANS
+from .daemon import Task, tasks, save, lock, evt, open_at, stopping
+from .windows import calendars
+from .cluster import owners
+from .fairshare import fair, jain, half_life
+from .profiler import report
+from .trace import export
+from . import selfmon
+
+PROTOCOL_VERSION = 2
+FOLLOW_BACKLOG = 8 * 1024  # bytes of current log sent when starting follow
+WATCH_QUEUE = 1000  # events buffered per watcher, dropped beyond
+INFO_TAIL_LINES = 20  # lines of task.log_tail shown by info
+HISTORY_LINES = 20  # runs shown by history
+WINDOW_TIME = '%a %Y-%m-%d %H:%M'
+
+# tasks changed by the batch of commands running, None for all, see _batch()
+_unsaved: t.Optional[list[t.Optional[Task]]] = None  # pylint: disable=invalid-name
+OP_FIELDS: dict[str, tuple[type, ...]] = {  # of protocol v2 ops, all optional
+    'cmd': (str,),
+    'tasks': (str, list),
+    'filter': (dict,),
+    'sort': (str,),
+    'arg': (str,),
+}
 
 
 def usage(_: str = '') -> str:
     r = f'Shine v{VERSION}\n'
     r += '\nGlobal commands:\n'
     r += ''.join([f'{k : <10}{v[0]}\n' for k, v in global_cmd.items()])
-    r += '\nPer-task commands:\n'
+    r += '\nPer-task commands (<task> may be names, globs or /regex/):\n'
     r += ''.join([f'{k : <10}{v[0]}\n' for k, v in per_task_cmd.items()])
+    r += '\nStreaming commands (any input or ^C to stop):\n'
+    r += ''.join([f'{k : <10}{v[0]}\n' for k, v in stream_cmd.items()])
     return r
 
 
@@ -35,29 +69,103 @@ def _time_duration(secs: float) -> str:
     )
 
 
-def show(_: str = '') -> str:
+def _table(rows: t.Sequence[t.Sequence[str]], columns: int = 0) -> str:
+    """rows as left aligned columns, the first ones only if columns given"""
+    columns = columns or len(rows[0])
+    width = [max(len(x[i]) for x in rows) + 1 for i in range(columns)]
+    return '\n'.join(
+        [''.join([f'{x[i]:<{width[i]}}' for i in range(columns)]) for x in rows]
+    )
+
+
+def _split(specs: str) -> list[str]:
+    """split like a shell, 'debian-*' unquoted, backslashes kept for /regex/"""
+    lexer = shlex.shlex(specs, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ''
+    try:
+        return list(lexer)
+    except ValueError:  # unbalanced quotes, taken literally
+        return specs.split()
+
+
+def select(specs: t.Union[str, list[str]]) -> list[Task]:
+    """tasks matching any of names, globs (debian-*) or /regex/"""
+    if isinstance(specs, str):
+        specs = _split(specs)
+    res: dict[str, Task] = {}
+    for spec in specs:
+        if spec in tasks:
+            res[spec] = tasks[spec]
+        elif len(spec) > 1 and spec.startswith('/') and spec.endswith('/'):
+            pattern = re.compile(spec[1:-1])
+            res.update({k: v for k, v in tasks.items() if pattern.search(k)})
+        else:
+            res.update({k: v for k, v in tasks.items() if fnmatchcase(k, spec)})
+    return list(res.values())
+
+
+def status(task: Task) -> dict[str, t.Any]:
+    return {
+        'name': task.name,
+        'on': task.on,
+        'active': task.active,
+        'fail_count': task.fail_count,
+        'fail_class': task.fail_class,
+        'last_success': task.last_success,
+        'last_start': task.last_start,
+        'last_finish': task.last_finish,
+        'next_sched': task.next_sched,
+        'size': task.size,
+        'owner': owners.get(task.name, NODE_NAME if not CLUSTER_LEASES else None),
+    }
+
+
+def show_status(
+    specs: t.Union[str, list[str], None] = None,
+    filters: t.Optional[dict[str, t.Any]] = None,
+    sort: str = 'name',
+) -> list[dict[str, t.Any]]:
+    """status of selected tasks, filtered by field equality, sorted by field"""
     with lock:
-        res = []
-        for task in tasks.values():
-            res.append(
-                (
-                    ('!' if task.fail_count else '')
-                    + ('~' if not task.on else '')
-                    + task.name,
-                    'SUCCESS' if not task.fail_count else f'{task.fail_count} FAIL',
-                    _time_duration(time() - task.last_finish),
-                    f'RUNNING {_time_duration(time()-task.last_start)}'
-                    if task.active
-                    else _time_duration(task.next_sched - time()),
-                )
-            )
-        res.sort(key=lambda x: x[0].lower())
-        # table printing
-        res.insert(0, ('NAME', 'STATUS', 'LAST', 'NEXT'))
-        width = [max(len(x[i]) for x in res) + 1 for i in range(4)]
-        return '\n'.join(
-            [''.join([f'{x[i]:<{width[i]}}' for i in range(4)]) for x in res]
+        res = [status(task) for task in (select(specs) if specs else tasks.values())]
+    res = [x for x in res if all(x.get(k) == v for k, v in (filters or {}).items())]
+    field = sort.lstrip('-')
+    res.sort(
+        key=lambda x: (*_order(x.get(field)), x['name'].lower()),
+        reverse=sort.startswith('-'),
+    )
+    return res
+
+
+def _order(value: t.Any) -> tuple[bool, bool, float, str]:
+    """sort key of mixed field values, numbers before strings before None"""
+    if value is None:
+        return (True, True, 0.0, '')
+    if isinstance(value, (int, float)):
+        return (False, False, float(value), '')
+    return (False, True, 0.0, str(value).lower())
+
+
+def show(arg: str = '') -> str:
+    res = [
+        (
+            ('!' if x['fail_count'] else '') + ('~' if not x['on'] else '') + x['name'],
+            'SUCCESS' if not x['fail_count'] else f'{x["fail_count"]} FAIL',
+            _time_duration(time() - x['last_finish']),
+            (
+                f'RUNNING {_time_duration(time()-x["last_start"])}'
+                if x['active']
+                else _time_duration(x['next_sched'] - time())
+            ),
+            x['owner'] or '-',
         )
+        for x in show_status(arg)
+    ]
+    res.sort(key=lambda x: x[0].lower())
+    # table printing
+    res.insert(0, ('NAME', 'STATUS', 'LAST', 'NEXT', 'OWNER'))
+    return _table(res, 5 if CLUSTER_LEASES else 4)
 
 
 def info(task: Task) -> str:
@@ -70,20 +178,43 @@ def info(task: Task) -> str:
         r += f'; running {_time_duration(time()-task.last_start)})\n'
     else:
         r += f'; next {_time_duration(task.next_sched-time())})\n'
-    for attr, val in task.__dict__.items():
-        if attr in {'name', 'on', 'fail_count', '_loaded', '_config'}:
+    for attr, val in {**task.dump(), **task.__dict__}.items():
+        if attr in {'name', 'on', 'fail_count', 'log_tail'} or attr in Task.CONFIG:
             continue
         if isinstance(val, MethodType):
             r += f'{attr}: {val.__doc__ or val}\n'
         else:
             r += f'{attr}: {val}\n'
     r += '\nConfig:\n'
+    r += ''.join([f'{k}: {getattr(task, k)}\n' for k in Task.CONFIG])
     # pylint: disable-next=protected-access
     r += ''.join([f'{k}: {v}\n' for k, v in task._config.items()])
+    if task.__dict__.get('log_tail'):
+        r += '\nLog tail:\n'
+        r += ''.join(task.log_tail.splitlines(True)[-INFO_TAIL_LINES:])
     return r
 
 
+def info_data(task: Task) -> dict[str, t.Any]:
+    return {
+        **task.dump(),
+        'active': task.active,
+        'log_tail': task.__dict__.get('log_tail'),
+        'methods': {
+            k: v.__doc__ or str(v)
+            for k, v in task.__dict__.items()
+            if isinstance(v, MethodType)
+        },
+        'config': {
+            **{k: getattr(task, k) for k in Task.CONFIG},
+            **task._config,  # pylint: disable=protected-access
+        },
+    }
+
+
 def start(task: Task) -> str:
+    if stopping.is_set():
+        return 'Daemon is stopping.'
     if task.active:
         return 'Task already running.'
     log.warning(f'force starting {task.name}')
@@ -95,16 +226,64 @@ def stop(task: Task) -> str:
     if not task.active:
         return 'Task is not running.'
     log.warning(f'force stopping {task.name}')
+    setattr(task, '_killed', None)
     if not task.kill():
         return 'Failed to stop the task.'
+    killed = getattr(task, '_killed', None)  # set by kill_pid() of System
+    if killed:
+        return 'Sent SIGTERM to:\n' + '\n'.join(killed)
     return 'Stopping attempted.'
 
 
+def history(task: Task) -> str:
+    runs = daemon.store.history(task.name, HISTORY_LINES)
+    if not runs:
+        return f'No run history of {task.name}, only kept with STATE_BACKEND=sqlite.'
+    res = [
+        (
+            strftime('%Y-%m-%d %H:%M:%S', localtime(x['start'])),
+            _time_duration(x['finish'] - x['start']),
+            'SUCCESS' if x['result'] else 'FAIL',
+            x['fail_class'] or '-',
+            str(x['size']) if x['size'] is not None else '-',
+        )
+        for x in runs
+    ]
+    res.insert(0, ('START', 'DURATION', 'RESULT', 'CLASS', 'SIZE'))
+    return _table(res)
+
+
+def _save(task: t.Optional[Task] = None) -> None:
+    if _unsaved is None:
+        save(task)
+    else:
+        _unsaved.append(task)
+
+
+@contextmanager
+def _batch() -> t.Iterator[None]:
+    """save once after the commands in the block, JsonStore rewrites the
+    whole file on every save, under lock"""
+    global _unsaved  # pylint: disable=global-statement,invalid-name
+    if _unsaved is not None:  # in a batch already
+        yield
+        return
+    _unsaved = []
+    try:
+        yield
+    finally:
+        changed, _unsaved = _unsaved, None
+        if len(changed) == 1:
+            save(changed[0])
+        elif changed:
+            save()
+
+
 def enable(task: Task) -> str:
     if task.on:
         return 'Task not disabled.'
     task.on = True
-    save()
+    _save(task)
     log.info(f'{task.name} on')
     return 'Enabled.'
 
@@ -113,7 +292,7 @@ def disable(task: Task) -> str:
     if not task.on:
         return 'Task not enabled.'
     task.on = False
-    save()
+    _save(task)
     log.info(f'{task.name} disabled')
     return 'Disabled.'
 
@@ -123,7 +302,7 @@ def remove(task: Task) -> str:
         log.warning(f'cannot remove running task {task.name}')
         return 'Task still running.'
     tasks.pop(task.name)
-    save()
+    _save()
     log.warning(f'{task.name} removed')
     return 'Task state removed, please delete config manually.'
 
@@ -134,6 +313,112 @@ def reload(_: str = '') -> str:
     return 'Reconfigured.'
 
 
+def profile(arg: str = '') -> str:
+    res = [
+        (
+            x['hook'],
+            str(x['calls']),
+            f'{x["avg"] * 1000:.1f}',
+            f'{x["max"] * 1000:.1f}',
+            str(x['timeouts']),
+            str(x['errors']),
+        )
+        for x in report(int(arg) if arg.isdigit() else 20)
+    ]
+    res.insert(0, ('HOOK', 'CALLS', 'AVG(ms)', 'MAX(ms)', 'TIMEOUTS', 'ERRORS'))
+    return _table(res)
+
+
+def windows(arg: str = '') -> str:
+    now = int(time())
+    r = ''
+    for group, calendar in sorted(calendars.items()):
+        r += f'{group or "(all tasks)"}: {"; ".join(calendar.specs)}\n'
+        for span in calendar.upcoming(now):
+            r += f'  {strftime(WINDOW_TIME, localtime(span[0]))} - '
+            r += f'{strftime(WINDOW_TIME, localtime(span[1]))}\n'
+    with lock:
+        selected = select(arg) if arg else list(tasks.values())
+        held = [(x.name, open_at(x.group, now)) for x in selected]
+    held = [x for x in held if x[1] > now or arg]
+    if held:
+        r += '\nTasks:\n' if r else ''
+        r += ''.join(
+            f'{name}: ' + (f'held {_time_duration(x - now)}\n' if x > now else 'open\n')
+            for name, x in held
+        )
+    return r or 'No blackouts.'
+
+
+def fairshare(_: str = '') -> str:
+    now = time()
+    with lock:
+        rows = [
+            (x, fair.decayed(x.name, now), fair.vtime(x))
+            for x in tasks.values()
+            if x.on
+        ]
+    total = sum(x[1] for x in rows) or 1.0
+    rows.sort(key=lambda x: x[2])
+    res = [
+        (
+            x.name,
+            x.group or '-',
+            f'{x.priority:g}',
+            _time_duration(usage) if usage >= 1 else '0',
+            f'{usage / total:.1%}',
+        )
+        for x, usage, _ in rows
+    ]
+    res.insert(0, ('NAME', 'GROUP', 'PRIORITY', 'USAGE', 'SHARE'))
+    r = _table(res)
+    index = jain([usage / max(x.priority, 1e-6) for x, usage, _ in rows])
+    r += f'\n\npolicy {SCHED_POLICY}, half-life {_time_duration(half_life)}'
+    r += f", Jain's index of usage / priority {index:.3f}"
+    return r
+
+
+def trace(arg: str = '') -> str:
+    if not TRACE_SPANS:
+        return 'Tracing is off, set TRACE_SPANS to the number of spans kept.'
+    try:
+        hours = float(arg or 0)
+    except ValueError:
+        return 'Usage: trace [hours]'
+    return json.dumps(export(time() - hours * 60 * 60 if hours else 0.0))
+
+
+def selfstat(arg: str = '') -> str:
+    args = arg.split()
+    if args[:1] == ['stop']:
+        selfmon.stop_tracing()
+        return 'tracemalloc stopped.'
+    if args[:1] == ['top']:
+        top = selfmon.top(int(args[1]) if args[1:] and args[1].isdigit() else 10)
+        if top is None:
+            return 'tracemalloc started, run again later to see growth.'
+        return '\n'.join(top) or 'No allocation growth.'
+    now = selfmon.sample()
+    first = selfmon.baseline or now
+    grown = selfmon.growth()
+    res = [('', 'NOW', 'START', 'GROWTH', 'LIMIT')]
+    for key, limit in selfmon.limits().items():
+        res.append(
+            (
+                key,
+                str(getattr(now, key)),
+                str(getattr(first, key)),
+                f'{grown[key]:+d}' if key in grown else '-',
+                str(limit or '-'),
+            )
+        )
+    r = _table(res)
+    r += f'\n\ntasks {now.tasks}, running {now.active}'
+    r += f', up {_time_duration(now.time - first.time)}'
+    r += f', {len(selfmon.history)} samples, growth of lowest of last {selfmon.WINDOW}'
+    return r
+
+
 def kill(_: str = '') -> str:
     os.kill(0, signal.SIGTERM)
     return 'Goodbye.'
@@ -141,13 +426,19 @@ def kill(_: str = '') -> str:
 
 global_cmd: dict[str, tuple[str, t.Callable[[str], str]]] = {
     'help': ('Show this help', usage),
-    'show': ('Print status', show),
+    'show': ('Print status [of <task>]', show),
     'reload': ('Reload plugins and tasks', reload),
+    'profile': ('Print slowest hooks [top N]', profile),
+    'windows': ('Print blackouts of next week [and state of <task>]', windows),
+    'fairshare': ('Print decayed runtime usage by task', fairshare),
+    'trace': ('Dump spans [of last N hours] as Chrome trace JSON', trace),
+    'selfstat': ('Print own resource use [top N allocations | stop]', selfstat),
     'KiLL': ('Kill all tasks and shutdown', kill),
 }
 
 per_task_cmd: dict[str, tuple[str, t.Callable[[Task], str]]] = {
     'info': ('Print <task> details', info),
+    'history': ('Print recent runs of <task>', history),
     'start': ('Force a <task> to start', start),
     'stop': ('Force a <task> to stop', stop),
     'enable': ('Enable a <task>', enable),
@@ -156,6 +447,172 @@ per_task_cmd: dict[str, tuple[str, t.Callable[[Task], str]]] = {
 }
 
 
+def _interrupted(conn: socket.socket) -> bool:
+    """peer sent anything or closed connection, without consuming input"""
+    try:
+        conn.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        return True
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+
+
+def follow(conn: socket.socket, arg: str) -> None:
+    with lock:
+        selected = select(arg) if arg else []
+    if len(selected) != 1:
+        _reply(conn, 'Specify exactly one task.\n')
+        return
+    task = selected[0]
+    path = None
+    f: t.Optional[t.BinaryIO] = None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    try:
+        while True:
+            current = task._log  # pylint: disable=protected-access
+            if current and current != path and os.path.exists(current):
+                if f:
+                    f.close()
+                f = open(current, 'rb')  # pylint: disable=consider-using-with
+                if path is None:  # only a tail of the log we start with
+                    f.seek(max(0, os.fstat(f.fileno()).st_size - FOLLOW_BACKLOG))
+                path = current
+                _reply(conn, f'==> {current} <==\n')
+            data = f.read(64 * 1024) if f else b''
+            if data:
+                _reply(conn, decoder.decode(data))
+            elif not task.active or _interrupted(conn):
+                return
+            else:
+                sleep(0.5)
+    finally:
+        if f:
+            f.close()
+
+
+def _describe(arg: t.Any) -> str:
+    if isinstance(arg, Task):
+        return arg.name
+    if isinstance(arg, list):
+        return ' '.join(x.name for x in arg if isinstance(x, Task))
+    return ''
+
+
+def watch(conn: socket.socket, arg: str) -> None:
+    events: queue.Queue[str] = queue.Queue(WATCH_QUEUE)
+    dropped = 0
+
+    def watcher(event: str, evt_arg: t.Any) -> None:
+        nonlocal dropped
+        if not event.startswith(arg):
+            return
+        try:  # never block the daemon on a slow client
+            events.put_nowait(f'{strftime("%H:%M:%S")} {event} {_describe(evt_arg)}')
+        except queue.Full:
+            dropped += 1
+
+    evt.watchers.append(watcher)
+    try:
+        while not _interrupted(conn):
+            try:
+                line = events.get(timeout=1)
+            except queue.Empty:
+                continue
+            if dropped:
+                _reply(conn, f'[{dropped} events dropped]\n')
+                dropped = 0
+            _reply(conn, line.rstrip() + '\n')
+    finally:
+        evt.watchers.remove(watcher)
+
+
+stream_cmd: dict[str, tuple[str, t.Callable[[socket.socket, str], None]]] = {
+    'follow': ('Stream current log of <task>', follow),
+    'watch': ('Stream events [starting with <prefix>]', watch),
+}
+
+
+def per_task(cmd: str, specs: t.Union[str, list[str]]) -> dict[str, t.Any]:
+    """run per-task command on selected tasks, under a single lock"""
+    with lock, _batch():
+        if cmd == 'remove':  # exact names only, `remove *` is never meant
+            names = _split(specs) if isinstance(specs, str) else specs
+            selected = [tasks[x] for x in dict.fromkeys(names) if x in tasks]
+        else:
+            selected = select(specs)
+        return {task.name: per_task_cmd[cmd][1](task) for task in selected}
+
+
+def _check(op: t.Any) -> None:
+    """raise TypeError unless op and its fields are of the expected types"""
+    if not isinstance(op, dict):
+        raise TypeError('op must be an object')
+    for field, types in OP_FIELDS.items():
+        if field in op and not isinstance(op[field], types):
+            names = ' or '.join(x.__name__ for x in types)
+            raise TypeError(f'{field} must be {names}')
+    if isinstance(op.get('tasks'), list):
+        if not all(isinstance(x, str) for x in op['tasks']):
+            raise TypeError('tasks must be a list of str')
+
+
+def handle_json(request: t.Any) -> dict[str, t.Any]:
+    """protocol v2: {"ops": [{"cmd": ..., "tasks": ..., ...}, ...]}"""
+    if not isinstance(request, dict):
+        return {'version': PROTOCOL_VERSION, 'error': 'request must be an object'}
+    ops = request.get('ops', [request])
+    if not isinstance(ops, list):
+        return {'version': PROTOCOL_VERSION, 'error': 'ops must be a list'}
+    results: list[dict[str, t.Any]] = []
+    with lock, _batch():
+        for op in ops:
+            try:
+                _check(op)
+                cmd = op['cmd']
+                if cmd == 'show':
+                    result: t.Any = show_status(
+                        op.get('tasks'), op.get('filter'), op.get('sort', 'name')
+                    )
+                elif cmd == 'info':
+                    result = {x.name: info_data(x) for x in select(op['tasks'])}
+                elif cmd in global_cmd:
+                    result = global_cmd[cmd][1](op.get('arg', ''))
+                elif cmd in per_task_cmd:
+                    result = per_task(cmd, op['tasks'])
+                else:
+                    raise ValueError(f'unknown command {cmd}')
+                results.append({'ok': True, 'result': result})
+            except (KeyError, TypeError, ValueError, re.error) as exc:
+                results.append({'ok': False, 'error': repr(exc)})
+    return {'version': PROTOCOL_VERSION, 'results': results}
+
+
+def handle_text(line: list[str]) -> str:
+    if line[0] in global_cmd:
+        return global_cmd[line[0]][1]((line + [''])[1].strip())  # default to empty
+    if line[0] not in per_task_cmd:
+        return usage()
+    if len(line) < 2:  # missing parameter
+        return 'Task not specified'
+    try:
+        results = per_task(line[0], line[1])
+    except re.error:
+        results = {}
+    if not results:
+        return 'Task not found.'
+    if len(results) == 1:
+        return str(next(iter(results.values())))
+    return '\n'.join(f'{k}: {v}' for k, v in results.items())
+
+
+def _reply(conn: socket.socket, result: str) -> None:
+    log.debug(f'response: {repr(result)}')
+    result_b = result.encode('utf-8', errors='ignore')
+    conn.sendall(int.to_bytes(len(result_b), 4, 'big'))
+    conn.sendall(result_b)
+
+
 def handle(conn: socket.socket) -> None:
     with conn:
         file = conn.makefile(encoding='utf-8', errors='ignore')
@@ -163,28 +620,28 @@ def handle(conn: socket.socket) -> None:
             line_b = file.readline()
             if not line_b:  # empty means EOF
                 break
+            if line_b.lstrip().startswith('{'):  # protocol v2
+                log.info(f'command: {repr(line_b.strip())}')
+                try:
+                    response = handle_json(json.loads(line_b))
+                except ValueError as exc:
+                    response = {'version': PROTOCOL_VERSION, 'error': repr(exc)}
+                _reply(conn, json.dumps(response, default=str))
+                continue
             line = line_b.split(maxsplit=1)
             if not line:  # only blank means empty line
                 continue
             log.info(f'command: {repr(line)}')
-            if line[0] in global_cmd:
-                result = global_cmd[line[0]][1](
-                    (line + [''])[1].strip()
-                )  # default to empty
-            elif line[0] in per_task_cmd:
-                with lock:
-                    if len(line) < 2:  # missing parameter
-                        result = 'Task not specified'
-                    elif line[1].strip() not in tasks:
-                        result = 'Task not found.'
-                    else:
-                        result = per_task_cmd[line[0]][1](tasks[line[1].strip()])
-            else:
-                result = usage()
-            log.debug(f'response: {repr(result)}')
-            result_b = result.encode('utf-8', errors='ignore')
-            conn.sendall(int.to_bytes(len(result_b), 4, 'big'))
-            conn.sendall(result_b)
+            if line[0] in stream_cmd:
+                _reply(conn, '')  # start of stream
+                try:
+                    stream_cmd[line[0]][1](conn, (line + [''])[1].strip())
+                    _reply(conn, '')  # end of stream
+                except OSError:
+                    log.info('stream closed by peer')
+                    break
+                continue
+            _reply(conn, handle_text(line))
 
 
 def comm() -> None:
@@ -2,57 +2,74 @@ import typing as t
 import logging as log
 import os
 import sys
-import json
 import signal
+import socket
+import sqlite3
 import threading
+from time import time
 from functools import wraps
-from types import FunctionType, MethodType
+from types import CodeType, FunctionType, MethodType
 
 CONFIG_DIR = os.getenv('CONFIGURATION_DIRECTORY', '.')
 PLUGINS_DIR = os.path.join(CONFIG_DIR, 'plugins')
 TASKS_DIR = os.path.join(CONFIG_DIR, 'tasks')
 STATE_DIR = os.getenv('STATE_DIRECTORY', '.')
 STATE_FILE = os.path.join(STATE_DIR, 'state.json')
+STATE_DB = os.path.join(STATE_DIR, 'state.db')
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'json')  # or sqlite
 RUN_DIR = os.getenv('RUNTIME_DIRECTORY', '.')
 COMM_SOCK = os.path.join(RUN_DIR, 'shined.sock')
 API_DIR = os.path.join(RUN_DIR, 'api')
 LOG_DIR = os.getenv('LOGS_DIRECTORY', './log/')
+HTTP_ADDR = os.getenv('HTTP_ADDR', '')  # e.g. 127.0.0.1:8080, off if empty
+SHUTDOWN_TIMEOUT = int(os.getenv('SHUTDOWN_TIMEOUT', '30'))  # seconds
+NODE_NAME = os.getenv('NODE_NAME', socket.gethostname())
+CLUSTER_LEASES = os.getenv('CLUSTER_LEASES', '')  # lease dir or *.db, off if empty
+LEASE_TTL = int(os.getenv('LEASE_TTL', '60'))  # seconds, failover after
+LEASE_SKEW = int(os.getenv('LEASE_SKEW', '5'))  # seconds clocks of nodes differ
+SCHED_POLICY = os.getenv('SCHED_POLICY', 'lateness')  # or fairshare
+# hold new starts above these, 0 for no limit
+MAX_LOAD = float(os.getenv('MAX_LOAD', '0'))  # 1 min load average per CPU
+MAX_IO_PRESSURE = float(os.getenv('MAX_IO_PRESSURE', '0'))  # PSI some avg10 %
+MAX_CPU_PRESSURE = float(os.getenv('MAX_CPU_PRESSURE', '0'))  # PSI some avg10 %
+TRACE_SPANS: int = int(os.getenv('TRACE_SPANS', '0'))  # kept for `trace`, 0 off
+SELFMON_INTERVAL = int(os.getenv('SELFMON_INTERVAL', '300'))  # seconds, 0 off
+# warn on growth of own resources since start above these, 0 for no limit
+MAX_RSS_GROWTH = os.getenv('MAX_RSS_GROWTH', '0')  # bytes or 512M style
+MAX_THREAD_GROWTH = int(os.getenv('MAX_THREAD_GROWTH', '0'))
+MAX_FD_GROWTH = int(os.getenv('MAX_FD_GROWTH', '0'))
 os.makedirs(API_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
 tasks: dict[str, 'Task'] = {}
 lock = threading.RLock()
 load_err = threading.Event()
+stopping = threading.Event()
 
 
-def save() -> bool:
+def save(task: t.Optional['Task'] = None) -> bool:
+    """save state of all tasks, or only task if the backend supports it"""
     if load_err.is_set():
         log.error('refuse to save after load error, reload first')
         return False
-    evt(':save')
+    evt(':save', task)
     log.debug('saving state')
     try:
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(
-                [
-                    {
-                        k: v
-                        for k, v in task.__dict__.items()
-                        if not k.startswith('_')
-                        and isinstance(v, (int, float, bool, str, dict, list))
-                    }
-                    for task in tasks.values()
-                ],
-                f,
-                default=lambda _: None,
-                skipkeys=True,
-            )
+        with span('save', 'state', task=task.name if task else None):
+            store.save(tasks, task)
         return True
-    except (OSError, ValueError):
+    except (OSError, ValueError, sqlite3.Error):
         log.exception('failed saving state!!')
         return False
 
 
+def record(task: 'Task', result: bool) -> None:
+    try:
+        store.record(task, result)
+    except sqlite3.Error:
+        log.exception('failed recording run history')
+
+
 def _scandir_py(path: str) -> list[os.DirEntry[str]]:
     try:
         return [
@@ -68,11 +85,25 @@ def _scandir_py(path: str) -> list[os.DirEntry[str]]:
         return []
 
 
-def _exec(file_name: str, local: t.Optional[dict[str, t.Any]] = None) -> bool:
+# path -> (mtime_ns, size, code), reloads only compile changed files
+_compiled: dict[str, tuple[int, int, CodeType]] = {}
+
+
+def _compile(file_name: str) -> CodeType:
+    stat = os.stat(file_name)
+    cached = _compiled.get(file_name)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(file_name, 'rb') as f:
+        code = compile(f.read(), f.name, 'exec')
+    _compiled[file_name] = (stat.st_mtime_ns, stat.st_size, code)
+    return code
+
+
+def _exec(file_name: str, namespace: t.Optional[dict[str, t.Any]] = None) -> bool:
     try:
-        with open(file_name, 'rb') as f:
-            # pylint: disable-next=exec-used
-            exec(compile(f.read(), f.name, 'exec'), globals(), local)
+        # pylint: disable-next=exec-used
+        exec(_compile(file_name), globals() if namespace is None else namespace)
         return True
     except Exception:  # pylint: disable=broad-except
         log.exception(f'exception loading file {file_name}!!')
@@ -82,6 +113,7 @@ def _exec(file_name: str, local: t.Optional[dict[str, t.Any]] = None) -> bool:
 
 def load_plugins() -> None:
     evt.registry.clear()
+    calendars.clear()
     for file in _scandir_py(PLUGINS_DIR):
         log.info(f'loading plugin {file.name}')
         _exec(file.path)
@@ -104,41 +136,79 @@ def _bind_method(task: 'Task', method: str, f: t.Callable[..., t.Any]) -> Method
     return MethodType(wrapper, task)
 
 
+def _task_configs(
+    file: os.DirEntry[str], base: dict[str, t.Any]
+) -> list[dict[str, t.Any]]:
+    """one config per entry of `tasks` in the file over the rest, or the file"""
+    namespace = base.copy()  # single namespace, comprehensions see file names
+    if not _exec(file.path, namespace):
+        return []  # skip on exception
+    config = {k: v for k, v in namespace.items() if k not in base or v is not base[k]}
+    entries = config.pop('tasks', None)
+    if entries is None:
+        return [config]
+    try:
+        return [{**config, **entry} for entry in entries]
+    except Exception:  # pylint: disable=broad-except
+        log.exception(f'invalid tasks in {file.name}!!')
+        load_err.set()
+        return []
+
+
+def _configure(task: 'Task', task_config: dict[str, t.Any], bare: 'Task') -> None:
+    task._config = {}  # pylint: disable=protected-access
+    for attr in Task.CONFIG:  # back to class default
+        task.__dict__.pop(attr, None)
+    for attr, val in task_config.items():
+        if attr in helpers.__all__:
+            continue
+        if isinstance(val, FunctionType):
+            val = _bind_method(task, attr, val)
+        try:
+            # pylint: disable-next=unnecessary-dunder-call
+            default = bare.__getattribute__(attr)
+            if isinstance(default, float) and isinstance(val, int):
+                val = float(val)
+            if type(val) is not type(default):
+                log.error(
+                    f'builtin attribute "{attr}" should be of type {type(default)}'
+                )
+                load_err.set()
+                continue
+            setattr(task, attr, val)
+        except AttributeError:
+            task._config[attr] = val  # pylint: disable=protected-access
+
+
 def load_tasks() -> None:
     _bare_task = Task()
+    base = dict(globals())  # what task files start from, same for all
     for task in tasks.values():
         setattr(task, '_loaded', False)
     for file in _scandir_py(TASKS_DIR):
         log.info(f'loading task {file.name}')
-        task_config: dict[str, t.Any] = {}
-        if not _exec(file.path, task_config):
-            continue  # skip on exception
-        name = task_config.get('name')
-        if not name or not isinstance(name, str):
-            log.error(f'name not present in task config {file.name}')
-            load_err.set()
-            continue
-        tasks.setdefault(name, Task())
-        task = tasks[name]
-        setattr(task, '_loaded', True)
-        task._config = {}  # pylint: disable=protected-access
-        for attr, val in task_config.items():
-            if attr in helpers.__all__:
+        configs = _task_configs(file, base)
+        if len(configs) > 1:
+            log.info(f'{file.name} defines {len(configs)} tasks')
+        for task_config in configs:
+            name = task_config.get('name')
+            if not name or not isinstance(name, str):
+                log.error(f'name not present in task config {file.name}')
+                load_err.set()
                 continue
-            if isinstance(val, FunctionType):
-                val = _bind_method(task, attr, val)
             try:
-                # pylint: disable-next=unnecessary-dunder-call
-                default = _bare_task.__getattribute__(attr)
-                if type(val) is not type(default):
-                    log.error(
-                        f'builtin attribute "{attr}" should be of type {type(default)}'
-                    )
-                    load_err.set()
-                    continue
-                setattr(task, attr, val)
-            except AttributeError:
-                task._config[attr] = val  # pylint: disable=protected-access
+                if 'min_free' in task_config:  # for the scheduler, see due()
+                    task_config['min_free'] = parse_size(task_config['min_free'])
+            except (TypeError, ValueError):
+                log.error(f'invalid min_free in task {name}, e.g. 20G or 20GiB')
+                load_err.set()
+                continue
+            tasks.setdefault(name, Task())
+            task = tasks[name]
+            if getattr(task, '_loaded', False):
+                log.warning(f'task {name} defined again in {file.name}, overriding')
+            setattr(task, '_loaded', True)
+            _configure(task, task_config, _bare_task)
 
     log.info(f'tasks: {repr(list(tasks.keys()))}')
     for task in tasks.values():
@@ -162,16 +232,42 @@ def reload(_signum: int = 0, _frame: t.Any = None) -> bool:
 
 
 def clean(signum: int = 0, _frame: t.Any = None) -> None:
+    if stopping.is_set():  # signal during shutdown
+        return
+    stopping.set()
     log.warning('stopping tasks')
     with lock:
-        for task in tasks.values():
-            if task.active:
-                task.kill()
+        running = [task for task in tasks.values() if task.active]
+        for task in running:  # only sends signals, stop them all in parallel
+            task.kill()
+    # without lock, so task threads can finish and save
+    deadline = time() + SHUTDOWN_TIMEOUT
+    for task in running:
+        thread = task._thread  # pylint: disable=protected-access
+        if thread:
+            thread.join(max(0.0, deadline - time()))
+    with lock:
+        still = [task.name for task in running if task.active]
+        if still:
+            log.error(f'tasks not stopped before deadline: {still}')
+        for task in running:  # own sessions, not reached by killpg(0) below
+            for pid, pgid in dict(task.__dict__.get('_system_procs', {})).items():
+                log.warning(f'killing process group {pgid or pid} of {task.name}')
+                try:
+                    if pgid:
+                        os.killpg(pgid, signal.SIGKILL)
+                    else:
+                        os.kill(pid, signal.SIGKILL)
+                except OSError:  # exited meanwhile
+                    pass
         log.warning('doing final saving')
         evt(':clean')
         save()
+        if CLUSTER_LEASES:
+            release_all()
         evt(':exit')
         log.warning('goodbye')
+        logpipe.stop()
         signal.signal(signal.SIGTERM, signal.SIG_DFL if signum else signal.SIG_IGN)
         os.killpg(0, signal.SIGTERM)
         sys.exit(0)
@@ -179,27 +275,31 @@ def clean(signum: int = 0, _frame: t.Any = None) -> None:
 
 def main() -> None:
     # setup logger
-    log.basicConfig(
-        format='[%(levelname)s] %(threadName)s: %(message)s',
-        level=(
-            log.DEBUG
-            if os.environ.get('DEBUG')
-            else log.WARNING
-            if os.environ.get('QUIET')
-            else log.INFO
-        ),
+    logpipe.setup(
+        log.DEBUG
+        if os.environ.get('DEBUG')
+        else log.WARNING
+        if os.environ.get('QUIET')
+        else log.INFO
     )
 
     # load state
-    log.info(f'loading state from {STATE_FILE}')
+    global store  # pylint: disable=global-statement,invalid-name
+    if STATE_BACKEND == 'sqlite':
+        log.info(f'loading state from {STATE_DB}')
+        try:
+            store = SqliteStore(STATE_DB, migrate_from=STATE_FILE)
+        except sqlite3.Error:
+            log.critical('error opening state database!!!', exc_info=True)
+            sys.exit(1)
+    else:
+        log.info(f'loading state from {STATE_FILE}')
     try:
-        with open(STATE_FILE, 'rb') as f:
-            state = json.load(f)
-        for task in state:
+        for task in store.load():
             tasks[task['name']] = Task(task)
     except FileNotFoundError:
         log.warning('state file not found')
-    except (OSError, KeyError, ValueError):
+    except (OSError, KeyError, ValueError, sqlite3.Error):
         log.critical('error loading state file!!!', exc_info=True)
         sys.exit(1)
 
@@ -216,6 +316,18 @@ def main() -> None:
     # start command thread
     threading.Thread(target=comm, name='comm', daemon=True).start()
 
+    # start http status thread
+    if HTTP_ADDR:
+        threading.Thread(target=httpd, name='httpd', daemon=True).start()
+
+    # start cluster lease thread
+    if CLUSTER_LEASES:
+        threading.Thread(target=cluster, name='cluster', daemon=True).start()
+
+    # start self monitoring thread
+    if SELFMON_INTERVAL:
+        threading.Thread(target=selfmon, name='selfmon', daemon=True).start()
+
     # start scheduler thread
     log.warning('starting scheduler')
     th_sched = threading.Thread(target=sched, name='sched', daemon=True)
@@ -231,10 +343,21 @@ def main() -> None:
 # pylint: disable=wrong-import-position
 # pylint: disable=unused-import
 # pylint: disable=cyclic-import
+from .trace import span
+from . import logpipe
 from .eventmgr import evt, event_handler
+from .windows import calendars, blackout, open_at
+from .executor import run_in_process
 from .task import Task
+from .health import parse_size
+from .state import StateStore, JsonStore, SqliteStore
 from .command import comm
+from .httpd import httpd
+from .cluster import cluster, release_all
 from .scheduler import sched
+from .selfmon import selfmon
+
+store: StateStore = JsonStore(STATE_FILE)
 
 # pylint: disable=wildcard-import,unused-wildcard-import
 from . import helpers
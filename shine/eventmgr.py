@@ -2,25 +2,30 @@ import typing as t
 import logging as log
 
 from .daemon import lock
+from .profiler import timed, hook_name
+from .trace import span
 
 AnyCallable = t.Callable[[t.Any], t.Any]
+Watcher = t.Callable[[str, t.Any], None]
 
 
 class EventManager:
     def __init__(self) -> None:
         self.registry: dict[str, list[AnyCallable]] = {}
+        # called on every event without lock, must not block; kept on reload
+        self.watchers: list[Watcher] = []
 
     def registered(self, event: str, callback: AnyCallable) -> bool:
         return callback in self.registry.get(event, [])
 
     def deregister(self, event: str, callback: AnyCallable) -> None:
         if self.registered(event, callback):
-            log.debug(f'deregister {callback} from event {event}')
+            log.debug('deregister {} from event {}', callback, event)
             self.registry[event].remove(callback)
 
     def register(self, event: str, callback: AnyCallable, insert: bool = False) -> None:
         self.deregister(event, callback)
-        log.debug(f'register {callback} to event {event}')
+        log.debug('register {} to event {}', callback, event)
         self.registry.setdefault(event, [])
         if insert:
             self.registry[event].insert(0, callback)
@@ -28,11 +33,20 @@ class EventManager:
             self.registry[event].append(callback)
 
     def __call__(self, event: str, arg: t.Optional[t.Any] = None) -> None:
-        log.debug(f'event {event}')
+        log.debug('event {}', event)
+        for watcher in list(self.watchers):
+            try:
+                hook = f'{event} {hook_name(watcher)}'
+                with timed(hook), span(hook, 'event'):
+                    watcher(event, arg)
+            except Exception:  # pylint: disable=broad-except
+                log.exception(f'exception caught in watcher of {event}')
         with lock:
             for callback in self.registry.get(event, []):
                 try:
-                    callback(arg)
+                    hook = f'{event} {hook_name(callback)}'
+                    with timed(hook), span(hook, 'event'):
+                        callback(arg)
                 except Exception:  # pylint: disable=broad-except
                     log.exception(f'exception caught in plugins handling {event}')
 
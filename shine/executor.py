@@ -0,0 +1,130 @@
+import typing as t
+import logging as log
+import os
+import signal
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+
+from .daemon import lock, _bind_method
+
+if t.TYPE_CHECKING:
+    from .task import Task
+
+# max concurrent worker processes, shared by all tasks with executor = 'process'
+workers = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+KILL_GRACE = 10  # seconds between SIGTERM and SIGKILL of a worker
+
+# fork is required: task methods are closures and cannot be pickled
+_ctx = mp.get_context('fork')
+
+STATE_TYPES = (int, float, bool, str, dict, list)
+
+
+def _state(task: 'Task') -> dict[str, t.Any]:
+    return {
+        **task.dump(),
+        **{
+            k: v
+            for k, v in task.__dict__.items()
+            if not k.startswith('_') and isinstance(v, STATE_TYPES)
+        },
+    }
+
+
+def _worker(task: 'Task', conn: Connection) -> None:
+    # inherited handlers would shut down the whole daemon
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def terminate(_signum: int, _frame: t.Any) -> None:
+        # let runners stop their own children, exit if there is none
+        if not task.kill():
+            raise SystemExit(1)
+
+    signal.signal(signal.SIGTERM, terminate)
+    log_file = task.log_file
+
+    def report_log(prefix: str = '') -> str:
+        path = log_file(prefix)
+        conn.send(('log', path))  # for `follow` while the worker runs
+        return path
+
+    setattr(task, 'log_file', report_log)
+    before = _state(task)
+    log.debug('worker pre()')
+    task.pre()
+    log.debug('worker run()')
+    result = bool(task.run())
+    log.debug('worker post()')
+    task.post(result)
+    changed = {k: v for k, v in _state(task).items() if before.get(k) != v}
+    conn.send(('result', (result, changed)))
+    conn.close()
+
+
+def _escalate(task: 'Task', proc: BaseProcess) -> None:
+    # e.g. stuck on a lock held at fork, run() never sees the SIGTERM
+    if proc.exitcode is None and task.__dict__.get('_worker') is proc:
+        log.warning(f'worker {proc.pid} did not exit after SIGTERM, killing')
+        proc.kill()
+
+
+def kill_worker(self: 'Task') -> bool:
+    proc = getattr(self, '_worker', None)
+    if not proc or proc.pid is None:
+        return False
+    try:
+        os.kill(proc.pid, signal.SIGTERM)
+    except OSError:
+        log.exception(f'error killing worker {proc.pid}')
+        return False
+    timer = threading.Timer(KILL_GRACE, _escalate, (self, proc))
+    timer.name = f'{self.name}-kill'
+    timer.daemon = True
+    timer.start()
+    return True
+
+
+def run_in_process(task: 'Task') -> bool:
+    """run pre(), run() and post() of task in a worker process"""
+    with workers:
+        recv_conn, send_conn = _ctx.Pipe(duplex=False)
+        proc = _ctx.Process(
+            target=_worker, args=(task, send_conn), name=f'{task.name}-worker'
+        )
+        kill = task.__dict__.get('kill')  # custom kill() of config, if any
+        kill_proc = _bind_method(task, 'kill', kill_worker)
+        # Fork while holding lock, so the worker owns its copy of it: only
+        # the forking thread exists in the child, a lock held by any other
+        # thread at fork would never be released there and save() deadlock.
+        with lock:
+            proc.start()
+            setattr(task, '_worker', proc)
+            setattr(task, 'kill', kill_proc)
+        send_conn.close()
+        log.debug(f'worker pid: {proc.pid}')
+        setattr(task, '_log', None)  # of an earlier run, maybe in a thread
+        try:
+            while (msg := recv_conn.recv())[0] == 'log':
+                setattr(task, '_log', msg[1])
+            result, changed = msg[1]
+        except (EOFError, OSError):
+            result, changed = False, {}
+        finally:
+            recv_conn.close()
+            proc.join()
+            delattr(task, '_worker')
+            if task.__dict__.get('kill') is kill_proc:  # not reloaded meanwhile
+                if kill is None:  # default kill() again, e.g. for thread runs
+                    del task.__dict__['kill']
+                else:
+                    setattr(task, 'kill', kill)
+        if proc.exitcode:
+            log.error(f'worker exited with code {proc.exitcode}')
+        with lock:
+            for attr, val in changed.items():
+                setattr(task, attr, val)
+        return bool(result)
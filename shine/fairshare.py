@@ -0,0 +1,125 @@
+import typing as t
+import heapq
+import threading
+from time import time
+
+from .daemon import Task, tasks
+
+# seconds for consumed runtime to count half as much
+half_life = 24 * 60 * 60  # pylint: disable=invalid-name
+
+
+def _group(task: Task) -> str:
+    return f'group:{task.group}' if task.group else f'task:{task.name}'
+
+
+class FairShare:
+    """Decayed runtime per task and group, picking the least virtual time
+
+    The virtual time of a task is its own plus its group's usage over its
+    priority, ungrouped tasks being a group of their own. Usage is stored
+    scaled by 2 ** (elapsed / half_life) since an epoch instead of decaying
+    every value, so decay never reorders tasks, and heap entries only go
+    stale when the usage of their task or group changes. Usage of each
+    task is saved with its state, groups are the sum of their members.
+    """
+
+    def __init__(self) -> None:
+        self.epoch = time()
+        self.usage: dict[str, float] = {}  # task name or group key -> scaled
+        self._heap: list[tuple[float, int, str]] = []  # (vtime, seq, task name)
+        self._seq: dict[str, int] = {}  # task name -> seq of its current entry
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def _scale(self, now: float) -> float:
+        return float(2 ** ((now - self.epoch) / half_life))
+
+    def vtime(self, task: Task) -> float:
+        own = self.usage.get(task.name, 0.0) + self.usage.get(_group(task), 0.0)
+        return own / max(task.priority, 1e-6)
+
+    def decayed(self, key: str, now: t.Optional[float] = None) -> float:
+        """seconds of runtime of task name or group key, after decay"""
+        return self.usage.get(key, 0.0) / self._scale(now or time())
+
+    def _push(self, task: Task) -> None:
+        self._next_seq += 1
+        self._seq[task.name] = self._next_seq
+        heapq.heappush(self._heap, (self.vtime(task), self._next_seq, task.name))
+
+    def charge(self, task: Task, seconds: float, now: t.Optional[float] = None) -> None:
+        now = now or time()
+        with self._lock:
+            scale = self._scale(now)
+            if scale > 2.0**500:  # renormalize long before floats overflow
+                self.usage = {k: v / scale for k, v in self.usage.items()}
+                self.epoch, scale = now, 1.0
+                self.reset()
+            group = _group(task)
+            self.usage[task.name] = self.usage.get(task.name, 0.0) + seconds * scale
+            self.usage[group] = self.usage.get(group, 0.0) + seconds * scale
+            task.fair_usage = {'seconds': self.usage[task.name] / scale, 'time': now}
+            for x in list(tasks.values()):  # group usage changes all members
+                if x.name in self._seq and _group(x) == group:
+                    self._push(x)
+            if len(self._heap) > 2 * len(self._seq) + 64:  # drop stale entries
+                self._heap = [x for x in self._heap if self._seq.get(x[2]) == x[1]]
+                heapq.heapify(self._heap)
+
+    def pick(self, runnables: list[Task]) -> t.Optional[Task]:
+        """runnable with the least virtual time
+
+        The heap only holds tasks seen runnable: entries of others are
+        dropped when they reach the top and pushed again once the task is
+        runnable. So beyond a lookup per runnable, a pick costs O(log n)
+        for each task that became runnable or not since, amortized.
+        """
+        candidates = {x.name: x for x in runnables}
+        with self._lock:
+            for task in runnables:
+                if task.name not in self._seq:
+                    self._push(task)
+            while self._heap:
+                _, seq, name = self._heap[0]
+                if self._seq.get(name) == seq and name in candidates:
+                    return candidates[name]
+                heapq.heappop(self._heap)
+                if self._seq.get(name) == seq:  # not runnable, not stale
+                    del self._seq[name]
+        return None
+
+    def reset(self) -> None:
+        """forget heap entries, e.g. after priorities or groups changed"""
+        self._heap.clear()
+        self._seq.clear()
+
+    def restore(self, now: t.Optional[float] = None) -> None:
+        """usage of tasks from their state, of groups as they are now"""
+        now = now or time()
+        with self._lock:
+            scale = self._scale(now)
+            self.usage = {}
+            for task in list(tasks.values()):
+                record = task.fair_usage or {}
+                elapsed = now - record.get('time', now)
+                seconds = record.get('seconds', 0.0) / 2 ** (elapsed / half_life)
+                for key in (task.name, _group(task)):
+                    self.usage[key] = self.usage.get(key, 0.0) + seconds * scale
+            self.reset()
+
+    def watch(self, event: str, arg: t.Any) -> None:
+        if event == 'task:post' and isinstance(arg, Task):
+            self.charge(arg, max(0.0, time() - arg.last_start))
+        elif event in (':tasks_load', 'sched:load'):  # state or groups changed
+            self.restore()
+
+
+def jain(values: list[float]) -> float:
+    """Jain's fairness index, 1 when all equal, 1/n when one takes all"""
+    total = sum(values)
+    squares = sum(x * x for x in values)
+    return total * total / (len(values) * squares) if squares else 1.0
+
+
+fair = FairShare()
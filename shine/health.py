@@ -0,0 +1,72 @@
+import typing as t
+import os
+import re
+
+from .daemon import MAX_LOAD, MAX_IO_PRESSURE, MAX_CPU_PRESSURE
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+SIZE = re.compile(r'(\d+(?:\.\d*)?)\s*([KMGT]?)(?:I?B)?', re.IGNORECASE)
+
+
+def parse_size(size: t.Union[int, str]) -> int:
+    """bytes of int or 500M, 20G, 20GiB or 20GB style str, all powers of 1024"""
+    if isinstance(size, int):
+        return size
+    match = SIZE.fullmatch(str(size).strip())
+    if not match:
+        raise ValueError(f'invalid size {size!r}')
+    return int(float(match[1]) * UNITS[match[2].upper()])
+
+
+def psi(resource: str) -> t.Optional[float]:
+    """% of the last 10s some tasks stalled on resource, None if unsupported"""
+    try:
+        with open(f'/proc/pressure/{resource}', encoding='utf-8') as f:
+            # some avg10=1.23 avg60=0.50 avg300=0.10 total=123456
+            fields = dict(x.split('=') for x in f.readline().split()[1:])
+        return float(fields['avg10'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def sample() -> dict[str, t.Optional[float]]:
+    return {
+        'load': os.getloadavg()[0] / (os.cpu_count() or 1),
+        'io': psi('io'),
+        'cpu': psi('cpu'),
+    }
+
+
+def pressure() -> t.Optional[str]:
+    """reason to hold new starts, if any threshold is exceeded"""
+    current = sample()
+    for key, limit in (
+        ('load', MAX_LOAD),
+        ('io', MAX_IO_PRESSURE),
+        ('cpu', MAX_CPU_PRESSURE),
+    ):
+        value = current[key]
+        if limit and value is not None and value > limit:
+            return f'{key} pressure {value:.2f} over {limit}'
+    return None
+
+
+def free_space(path: str) -> t.Optional[int]:
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def low_space(
+    local: t.Optional[str], min_free: t.Union[int, str, None]
+) -> t.Optional[str]:
+    """reason not to start syncing into local, if it has less than min_free"""
+    needed = parse_size(min_free or 0)
+    if not local or not needed:
+        return None
+    free = free_space(local)
+    if free is None or free >= needed:
+        return None
+    return f'{local} has {free} bytes free, {needed} needed'
@@ -5,5 +5,21 @@ from .exit0 import Exit0
 from .interval import Interval
 from .cron import Cron
 from .earliest import Earliest
+from .inventory import Inventory
+from .manifest import Manifest
+from .chain import Chain
+from .table import Table
 
-__all__ = ['Rsync', 'System', 'Demo', 'Exit0', 'Interval', 'Cron', 'Earliest']
+__all__ = [
+    'Rsync',
+    'System',
+    'Demo',
+    'Exit0',
+    'Interval',
+    'Cron',
+    'Earliest',
+    'Inventory',
+    'Manifest',
+    'Chain',
+    'Table',
+]
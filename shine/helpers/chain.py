@@ -0,0 +1,14 @@
+import typing as t
+
+from ..daemon import Task
+
+
+def Chain(*f: t.Callable[..., t.Any]) -> t.Callable[..., None]:
+    """Call multiple hooks in order, e.g. success = Chain(Inventory(...), ...)"""
+
+    def hook(self: Task, *args: t.Any) -> None:
+        for x in f:
+            x(self, *args)
+
+    hook.__doc__ = f'Chain({", ".join(x.__doc__ or str(x) for x in f)})'
+    return hook
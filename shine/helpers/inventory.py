@@ -0,0 +1,118 @@
+import typing as t
+import logging as log
+import os
+import threading
+from time import time
+
+from ..daemon import Task, save, lock
+from ..logpipe import current, attach
+
+# dir path -> (ctime_ns, size of files, count of files, subdir names)
+DirInfo = tuple[int, int, int, tuple[str, ...]]
+
+# seconds after which a scan ignores the cache, see scan()
+full_scan_interval = 24 * 60 * 60  # pylint: disable=invalid-name
+
+# root -> (time of last full scan, dir infos)
+_caches: dict[str, tuple[float, dict[str, DirInfo]]] = {}
+_scanning: set[str] = set()
+_scanning_lock = threading.Lock()
+_daemon_pid = os.getpid()
+
+
+def _scan_dir(path: str, ctime_ns: int) -> DirInfo:
+    size = count = 0
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    size += entry.stat(follow_symlinks=False).st_size
+                    count += 1
+            except OSError:  # vanished during scan
+                continue
+    return (ctime_ns, size, count, tuple(subdirs))
+
+
+def scan(root: str) -> tuple[int, int]:
+    """Return total size and file count of root, reusing unchanged dirs
+
+    A dir is rescanned when its ctime changed, i.e. entries were added,
+    removed or renamed, which covers rsync renaming updated files into
+    place. Unlike mtime, ctime cannot be restored by rsync -t. Files
+    rewritten in place (--inplace, reflink snapshots) leave their dir
+    unchanged, so at most every full_scan_interval the cache is ignored.
+    """
+    now = time()
+    full_at, cache = _caches.get(root, (0.0, {}))
+    if now - full_at >= full_scan_interval:
+        full_at, cache = now, {}
+    new_cache: dict[str, DirInfo] = {}
+    size = count = 0
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            ctime_ns = os.stat(path).st_ctime_ns
+            info = cache.get(path)
+            if not info or info[0] != ctime_ns:
+                info = _scan_dir(path, ctime_ns)
+        except OSError:
+            log.warning(f'Inventory: failed scanning {path}')
+            continue
+        new_cache[path] = info
+        size += info[1]
+        count += info[2]
+        stack.extend(os.path.join(path, x) for x in info[3])
+    _caches[root] = (full_at, new_cache)
+    return (size, count)
+
+
+def scan_task(task: Task, root: str) -> None:
+    """Scan root in a background thread and publish size and file_count"""
+    with _scanning_lock:
+        if root in _scanning:
+            log.info(f'Inventory: {root} is being scanned, skipping')
+            return
+        _scanning.add(root)
+
+    run_log = current()
+
+    def thread() -> None:
+        try:
+            started = time()
+            with attach(run_log):
+                size, count = scan(root)
+                log.info(
+                    f'Inventory: {root} has {count} files, {size} bytes, '
+                    f'scanned in {time() - started:.1f}s'
+                )
+            with lock:
+                setattr(task, 'size', size)
+                setattr(task, 'file_count', count)
+                if in_daemon:
+                    save(task)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Inventory: error scanning')
+        finally:
+            with _scanning_lock:
+                _scanning.discard(root)
+
+    # in a process worker, scan inline so results are sent back with the run
+    in_daemon = os.getpid() == _daemon_pid
+    if not in_daemon:
+        thread()
+        return
+    threading.Thread(target=thread, name=f'{task.name}-inventory').start()
+
+
+def Inventory(local: str) -> t.Callable[[Task], None]:
+    """Scan local tree in background, publish size and file_count"""
+
+    def hook(self: Task, *_: t.Any) -> None:
+        scan_task(self, local)
+
+    hook.__doc__ = f'Inventory({repr(local)})'
+    return hook
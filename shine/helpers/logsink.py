@@ -0,0 +1,154 @@
+import typing as t
+import logging as log
+import os
+import gzip
+import fcntl
+import tempfile
+import threading
+from collections import OrderedDict
+
+TAIL_SIZE = 64 * 1024  # bytes of log output kept in memory
+PIPE_SIZE = 1024 * 1024  # kernel pipe buffer, where supported
+TAIL_CACHE = 64  # tails of recent logs kept by path, for read_log()
+MIN_CAP = 1024  # bytes, smallest cap, head and tail of half of it each
+
+_tails: 'OrderedDict[str, bytes]' = OrderedDict()
+_tails_lock = threading.Lock()
+
+
+def read_log(path: str, limit: int = 0) -> str:
+    """Tail of a log from memory if a sink kept it, else the file or its end"""
+    with _tails_lock:
+        data = _tails.get(path)
+    if data is None and path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+    elif data is None:
+        with open(path, 'rb') as f:
+            if limit:
+                f.seek(max(0, f.seek(0, os.SEEK_END) - limit))
+            data = f.read()
+    return data[-limit:].decode('utf-8', errors='ignore')
+
+
+class LogSink:  # pylint: disable=too-many-instance-attributes
+    """Drain a pipe into a log file, keeping only head and tail past cap
+
+    Output past the head is spooled into two alternating temporary files
+    of cap / 2 bytes each, the tail is copied from them when the pipe
+    closes, so neither memory nor disk grows with the output size. The
+    file holds at most cap bytes of output and a line on the bytes skipped.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cap: int = 0,  # bytes on disk, 0 for unlimited
+        tail: int = TAIL_SIZE,  # bytes kept in memory
+        compress: bool = False,  # gzip the log file
+        append: bool = False,
+    ) -> None:
+        if 0 < cap < MIN_CAP:
+            raise ValueError(f'LogSink: cap below {MIN_CAP} bytes')
+        self.path = path + '.gz' if compress else path
+        self.tail_size = tail
+        self.tail = b''
+        self._segment = cap // 2
+        self._head = cap - self._segment
+        self._written = 0
+        self._spooled = 0
+        self._spool: list[t.BinaryIO] = []
+        self._ring = bytearray()
+        mode = 'ab' if append else 'wb'
+        self._file: t.Union[gzip.GzipFile, t.IO[t.Any]]
+        if compress:
+            self._file = gzip.GzipFile(self.path, mode)
+        else:
+            # pylint: disable-next=consider-using-with
+            self._file = open(self.path, mode)
+        self._read_fd, self.fd = os.pipe()  # fd for the child stdout
+        if hasattr(fcntl, 'F_SETPIPE_SZ'):  # fewer wakeups on chatty output
+            try:
+                fcntl.fcntl(self.fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+            except OSError:
+                pass
+        self._thread = threading.Thread(
+            target=self._drain,
+            name=f'{threading.current_thread().name}-log',
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        """Start draining, after the child got a copy of fd"""
+        os.close(self.fd)
+        self._thread.start()
+
+    def close(self, timeout: t.Optional[float] = None) -> None:
+        """Wait for the writers of the pipe to exit, or close it unused"""
+        if not self._thread.is_alive() and self._read_fd >= 0:  # never started
+            os.close(self.fd)
+            self._drain()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.warning(f'LogSink: {self.path} still open by other processes')
+
+    def _write(self, data: bytes) -> None:
+        self._ring += data
+        del self._ring[: -self.tail_size or len(self._ring)]
+        if not self._head or self._written < self._head:
+            chunk = data[: self._head - self._written] if self._head else data
+            self._file.write(chunk)
+            self._written += len(chunk)
+            data = data[len(chunk) :]
+        while data:
+            if not self._spool:
+                self._spool = [
+                    t.cast(
+                        t.BinaryIO,
+                        tempfile.TemporaryFile(dir=os.path.dirname(self.path) or None),
+                    )
+                    for _ in range(2)
+                ]
+            current = self._spool[0]
+            if current.tell() >= self._segment:  # swap, reuse the older segment
+                self._spool.reverse()
+                current = self._spool[0]
+                current.seek(0)
+                current.truncate()
+            chunk = data[: self._segment - current.tell()]
+            current.write(chunk)
+            self._spooled += len(chunk)
+            data = data[len(chunk) :]
+
+    def _finish(self) -> None:
+        if self._spool:
+            current, older = self._spool
+            size = current.tell()
+            older_size = older.seek(0, os.SEEK_END)
+            keep = min(older_size, self._segment - size)
+            skipped = self._spooled - size - keep
+            if skipped:
+                self._file.write(f'\n... {skipped} bytes skipped ...\n'.encode())
+            older.seek(older_size - keep)
+            current.seek(0)
+            for f in (older, current):
+                while data := f.read(1024 * 1024):
+                    self._file.write(data)
+                f.close()
+        self._file.close()
+        self.tail = bytes(self._ring)
+        with _tails_lock:
+            _tails[self.path] = self.tail
+            while len(_tails) > TAIL_CACHE:
+                _tails.popitem(last=False)
+
+    def _drain(self) -> None:
+        try:
+            while data := os.read(self._read_fd, PIPE_SIZE):
+                self._write(data)
+            self._finish()
+        except (OSError, ValueError):
+            log.exception(f'LogSink: failed writing {self.path}')
+        finally:
+            os.close(self._read_fd)
+            self._read_fd = -1
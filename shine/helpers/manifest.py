@@ -0,0 +1,167 @@
+import typing as t
+import logging as log
+import os
+import hashlib
+import threading
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..daemon import Task, evt
+from ..logpipe import current, attach
+
+BUF_SIZE = 1 << 20  # read and hashed at once, hashlib releases the GIL
+
+# relative path -> (size, mtime, hash)
+Entries = dict[str, tuple[int, int, str]]
+
+# manifest file being updated -> name of its task, held from running again
+_running: dict[str, str] = {}
+_running_lock = threading.Lock()
+
+
+def _hold(event: str, runnables: t.Any) -> None:
+    """keep tasks out of runnables while their manifest is updated, a new
+    run would change the files being hashed"""
+    if event != 'sched:runnables' or not _running:
+        return
+    with _running_lock:
+        busy = set(_running.values())
+    for task in [x for x in runnables if x.name in busy]:
+        log.debug(f'Manifest: holding {task.name} until its manifest is updated')
+        runnables.remove(task)
+
+
+evt.watchers.append(_hold)
+
+
+def hash_file(path: str, algorithm: str = 'sha256') -> str:
+    # no mmap: a file truncated while mapped kills the daemon with SIGBUS
+    h = hashlib.new(algorithm)
+    with open(path, 'rb', buffering=0) as f:
+        buf = bytearray(BUF_SIZE)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def _walk(root: str, exclude: str) -> t.Iterator[tuple[str, int, int]]:
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel)) as it:
+                for entry in it:
+                    path = os.path.join(rel, entry.name)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(path)
+                        elif entry.is_file(follow_symlinks=False):
+                            if entry.path == exclude or '\n' in path:
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                            yield (path, st.st_size, int(st.st_mtime))
+                    except OSError:  # vanished during walk
+                        continue
+        except OSError:
+            log.warning(f'Manifest: failed reading {os.path.join(root, rel)}')
+
+
+def read_manifest(file: str) -> Entries:
+    entries: Entries = {}
+    try:
+        with open(file, encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                digest, size, mtime, path = line.rstrip('\n').split('\t', 3)
+                entries[path] = (int(size), int(mtime), digest)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        log.warning(f'Manifest: failed reading {file}, rehashing all')
+        return {}
+    return entries
+
+
+def write_manifest(file: str, entries: Entries, algorithm: str) -> None:
+    tmp = f'{file}.tmp'
+    with open(tmp, 'w', encoding='utf-8', errors='surrogateescape') as f:
+        f.write(f'# {algorithm}\tsize\tmtime\tpath\n')
+        for path in sorted(entries):
+            size, mtime, digest = entries[path]
+            f.write(f'{digest}\t{size}\t{mtime}\t{path}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, file)
+
+
+def update_manifest(
+    local: str, file: str, algorithm: str = 'sha256', workers: int = 4
+) -> Entries:
+    """Rehash files with changed size or mtime, write manifest atomically"""
+    started = time()
+    old = read_manifest(file)
+    new: Entries = {}
+    stale: list[tuple[str, int, int]] = []
+    for path, size, mtime in _walk(local, os.path.abspath(file)):
+        prev = old.get(path)
+        if prev and prev[:2] == (size, mtime):
+            new[path] = prev
+        else:
+            stale.append((path, size, mtime))
+
+    def rehash(item: tuple[str, int, int]) -> None:
+        path, size, mtime = item
+        try:
+            new[path] = (size, mtime, hash_file(os.path.join(local, path), algorithm))
+        except OSError:  # vanished or unreadable
+            log.warning(f'Manifest: failed hashing {path}')
+
+    with ThreadPoolExecutor(workers, thread_name_prefix='manifest') as pool:
+        list(pool.map(rehash, stale))
+    write_manifest(file, new, algorithm)
+    log.info(
+        f'Manifest: {len(new)} files, {len(stale)} rehashed '
+        f'in {time() - started:.1f}s'
+    )
+    return new
+
+
+def Manifest(
+    local: str,
+    manifest: t.Optional[str] = None,  # defaults to <local>.manifest
+    algorithm: str = 'sha256',
+    workers: int = 4,  # hashing threads
+) -> t.Callable[[Task], None]:
+    """Maintain a checksum manifest of local tree in background"""
+    if algorithm not in hashlib.algorithms_available:
+        raise ValueError(f'Manifest: unknown algorithm {algorithm}')
+    file = manifest or local.rstrip('/') + '.manifest'
+
+    def hook(self: Task, *_: t.Any) -> None:
+        with _running_lock:
+            if file in _running:
+                log.info(f'Manifest: {file} is being updated, skipping')
+                return
+            _running[file] = self.name
+
+        run_log = current()
+
+        def thread() -> None:
+            try:
+                with attach(run_log):
+                    update_manifest(local, file, algorithm, workers)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Manifest: error updating')
+            finally:
+                with _running_lock:
+                    _running.pop(file, None)
+
+        threading.Thread(target=thread, name=f'{self.name}-manifest').start()
+
+    hook.__doc__ = (
+        f'Manifest({repr(local)}, manifest={repr(file)}, '
+        f'algorithm={repr(algorithm)}, workers={workers})'
+    )
+    return hook
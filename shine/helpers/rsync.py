@@ -2,11 +2,22 @@ import typing as t
 import logging as log
 import re
 import os
-from time import sleep
+import hashlib
+import tempfile
+import threading
+import subprocess
+from time import sleep, time, monotonic
+from fnmatch import fnmatchcase
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 from ..daemon import Task
 from .system import System
+from .logsink import read_log
+from .inventory import scan_task
+from .snapshot import snapshot_root, prepare, publish, prune
+from ..health import parse_size, low_space
+from ..logpipe import current, attach
 
 DEFAULT_OPTIONS = [
     '-virltpH',
@@ -43,11 +54,251 @@ EXIT_CODE = {  # base on rsync 3.2.6
     35: 'Timeout waiting for daemon connection',
 }
 
+FAIL_CLASS = {  # exit code -> failure class, see Task.retry()
+    1: 'fatal',
+    2: 'fatal',
+    3: 'fatal',
+    4: 'fatal',
+    5: 'network',
+    10: 'network',
+    12: 'network',
+    23: 'partial',
+    24: 'partial',
+    30: 'network',
+    35: 'network',
+}
+
+STATS_SIZE = 64 * 1024  # bytes at the end of a log read for --stats output
+FAIL_MARKERS = {  # log content -> failure class, overrides exit code
+    '@ERROR: Unknown module': 'fatal',
+    '@ERROR: auth failed': 'fatal',
+    '@ERROR: access denied': 'fatal',
+    '@ERROR: max connections': 'network',
+    'Connection refused': 'network',
+    'Connection timed out': 'network',
+    'No route to host': 'network',
+    'Name or service not known': 'network',
+    'Temporary failure in name resolution': 'network',
+}
+
+
+def classify(ret: int, out: str) -> str:
+    """Guess failure class from exit code and the end of log"""
+    try:
+        log_tail = read_log(out, 64 * 1024)
+    except OSError:
+        log_tail = ''
+    for marker, fail_class in FAIL_MARKERS.items():
+        if marker in log_tail:
+            return fail_class
+    return FAIL_CLASS.get(ret, '')
+
+
+# rsync processes of all sharded runs at once
+shard_slots = threading.BoundedSemaphore(8)  # pylint: disable=invalid-name
+
+
+def list_dirs(
+    upstream: str,
+    excutable: str = 'rsync',
+    options: t.Optional[list[str]] = None,
+    env: t.Optional[dict[str, str]] = None,
+    timeout: t.Optional[int] = 300,
+) -> list[str]:
+    """Top-level directories of upstream, empty on error"""
+    try:
+        listing = subprocess.run(
+            [excutable, '--list-only', '--no-motd'] + (options or []) + [upstream],
+            env=env,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=timeout,
+            check=True,
+        ).stdout.decode('utf-8', errors='surrogateescape')
+    except (OSError, subprocess.SubprocessError):
+        log.warning('Rsync: failed listing upstream for shards', exc_info=True)
+        return []
+    # drwxr-xr-x          4,096 2023/01/01 00:00:00 name with spaces
+    fields = [line.split(None, 4) for line in listing.splitlines()]
+    return [x[4] for x in fields if len(x) == 5 and x[0][0] == 'd' and x[4] != '.']
+
+
+# prefix of an include/exclude arg or filter rule -> whether it includes
+FILTER_PREFIX = {
+    '--exclude=': False,
+    '--include=': True,
+    '--filter=- ': False,
+    '--filter=+ ': True,
+    '- ': False,  # rules following -f
+    '+ ': True,
+}
+
+
+def _rebase(pattern: str, path: str) -> t.Optional[str]:
+    """Anchored pattern relative to shard path, '' if it is the shard itself,
+    None if it is of another shard"""
+    for part in path.strip('/').split('/'):
+        first, _, rest = pattern[1:].partition('/')
+        if '**' in first:  # may match any depth, also within the shard
+            return pattern
+        if not fnmatchcase(part, first):
+            return None
+        pattern = '/' + rest
+    return pattern if pattern != '/' else ''
+
+
+def shard_filters(exclude: list[str], path: str) -> t.Optional[list[str]]:
+    """Include/exclude args of the module root rebased onto shard path
+
+    Anchored patterns like /pub/tmp become /tmp for shard pub and are
+    dropped for other shards, unanchored ones and other args are passed
+    through, so are patterns in --exclude-from files. None if the shard
+    itself is excluded.
+    """
+    res: list[str] = []
+    decided = False  # the first rule matching the shard itself wins
+    args = iter(exclude)
+    for arg in args:
+        if arg in ('--exclude', '--include'):  # pattern in the next arg
+            arg += '=' + next(args, '')
+        head = []
+        if arg in ('-f', '--filter'):  # rule in the next arg
+            head, arg = [arg], next(args, '')
+        prefix = next((x for x in FILTER_PREFIX if arg.startswith(x)), None)
+        pattern = arg[len(prefix) :] if prefix else ''
+        if prefix is None or not pattern.startswith('/'):
+            res += head + [arg]  # unanchored, or not a pattern
+            continue
+        rebased = _rebase(pattern, path)
+        if rebased == '' and not decided:
+            decided = True
+            if not FILTER_PREFIX[prefix]:
+                return None
+        if rebased:
+            res += head + [prefix + rebased]
+    return res
+
+
+def transfer_stats(out: str) -> tuple[int, int]:
+    """Files and bytes transferred, from --stats output in log"""
+    try:
+        content = read_log(out, STATS_SIZE)
+        files = re.findall(
+            r'^Number of regular files transferred: ([0-9]+)', content, re.MULTILINE
+        )
+        size = re.findall(
+            r'^Total transferred file size: ([0-9]+) bytes', content, re.MULTILINE
+        )
+        return (int(files[-1]) if files else 0, int(size[-1]) if size else 0)
+    except (OSError, ValueError):
+        return (0, 0)
+
+
+def fetch_marker(
+    # pylint: disable=too-many-arguments
+    preflight: t.Union[str, list[str]],
+    upstream: str,
+    excutable: str = 'rsync',
+    options: t.Optional[list[str]] = None,
+    env: t.Optional[dict[str, str]] = None,
+    timeout: t.Optional[int] = 300,
+) -> t.Optional[str]:
+    """Return digest of upstream marker file or command output, None on error"""
+    try:
+        if isinstance(preflight, str):  # path relative to upstream
+            with tempfile.TemporaryDirectory(prefix='shine-') as tmp:
+                dest = os.path.join(tmp, 'marker')
+                subprocess.run(
+                    [excutable, '--no-motd', '-q']
+                    + (options or [])
+                    + [upstream + preflight, dest],
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    timeout=timeout,
+                    check=True,
+                )
+                with open(dest, 'rb') as f:
+                    content = f.read()
+        else:  # command printing the marker
+            content = subprocess.run(
+                preflight,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=timeout,
+                check=True,
+            ).stdout
+    except (OSError, subprocess.SubprocessError):
+        log.warning('Rsync: preflight failed, doing full sync', exc_info=True)
+        return None
+    return hashlib.sha256(content).hexdigest()
+
+
+# seconds between latency probes of each upstream of a task
+probe_interval = 10 * 60  # pylint: disable=invalid-name
+# seconds an upstream that failed to connect is only tried after the others
+failed_backoff = 60 * 60  # pylint: disable=invalid-name
+THROUGHPUT_WEIGHT = 0.3  # of the latest run in the moving average
+MIN_SAMPLE = 1024 * 1024  # bytes, smaller transfers mostly time the file list
+
+
+def probe(
+    upstream: str,
+    excutable: str = 'rsync',
+    options: t.Optional[list[str]] = None,
+    env: t.Optional[dict[str, str]] = None,
+    timeout: t.Optional[int] = 30,
+) -> t.Optional[float]:
+    """Seconds upstream takes to list its top level, None on error"""
+    start = monotonic()
+    try:
+        subprocess.run(
+            [excutable, '--list-only', '--no-motd'] + (options or []) + [upstream],
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        log.warning(f'Rsync: probing {upstream} failed')
+        return None
+    return monotonic() - start
+
+
+def rank_upstreams(
+    upstreams: list[str], stats: dict[str, dict[str, t.Any]], now: float
+) -> list[str]:
+    """Upstreams by expected sync time, recently failed or unreachable last
+
+    The expected time is the probed latency plus the typical transfer at
+    the average throughput of the upstream, or at that of the fastest one
+    while it has none, so new upstreams get a chance.
+    """
+    known = [stats[x]['bps'] for x in upstreams if stats.get(x, {}).get('bps')]
+    fastest = max(known, default=0.0)
+    typical = max((stats.get(x, {}).get('bytes', 0) for x in upstreams), default=0)
+
+    def cost(upstream: str) -> tuple[bool, bool, float, int]:
+        record = stats.get(upstream, {})
+        latency = record.get('latency')
+        bps = record.get('bps') or fastest
+        return (
+            now - record.get('failed', 0) < failed_backoff,
+            latency is None,
+            (latency or 0.0) + (typical / bps if bps else 0.0),
+            upstreams.index(upstream),
+        )
+
+    return sorted(upstreams, key=cost)
+
 
-# pylint: disable=too-many-statements
+# pylint: disable=too-many-statements,too-many-branches,too-many-return-statements
 def Rsync(
     # pylint: disable=too-many-arguments
-    upstream: str,  # ends with / 'rsync://example.com/example/',
+    upstream: t.Union[str, list[str]],  # ends with / 'rsync://example.com/example/',
     local: str,
     ipv: t.Optional[int] = None,
     options: t.Optional[list[str]] = None,
@@ -60,6 +311,14 @@ def Rsync(
     excutable: str = 'rsync',
     no_default_options: bool = False,
     no_extract_size: bool = False,
+    scan_local: bool = False,  # scan local tree for size instead of the log
+    preflight: t.Union[str, list[str], None] = None,  # marker path or command
+    shards: t.Union[str, list[str], None] = None,  # 'auto' or top-level dirs
+    shard_jobs: int = 4,  # parallel rsync processes for shards
+    min_free: t.Union[int, str] = 0,  # bytes or 20G style str free on local
+    probe_timeout: int = 30,  # seconds for latency probes of multiple upstreams
+    snapshots: int = 0,  # keep this many, sync into a new one, local a symlink
+    reflink: bool = False,  # copy the previous snapshot instead of --link-dest
     **popen_kwargs: t.Any,
 ) -> t.Callable[[Task], tuple[int, str]]:
     # pylint: disable=too-many-locals
@@ -71,6 +330,12 @@ def Rsync(
         + (f', exclude={exclude}' if exclude else '')
         + (f', env={env}' if env else '')
         + (f', timeout={timeout}' if timeout else '')
+        + (f', scan_local={scan_local}' if scan_local else '')
+        + (f', preflight={repr(preflight)}' if preflight else '')
+        + (f', shards={repr(shards)}, shard_jobs={shard_jobs}' if shards else '')
+        + (f', min_free={repr(min_free)}' if min_free else '')
+        + (f', snapshots={snapshots}' if snapshots else '')
+        + (f', reflink={reflink}' if reflink else '')
         + ')'
     )
     options = options or []
@@ -89,20 +354,32 @@ def Rsync(
     if no_default_options is False:
         options = DEFAULT_OPTIONS + options
     try:
-        os.makedirs(local, exist_ok=True)
+        os.makedirs(snapshot_root(local) if snapshots else local, exist_ok=True)
     except OSError as exc:
         raise OSError('Rsync: local dir does not exist') from exc
 
-    argv = [excutable] + options + exclude + [upstream, local]
-    if pre_stage:
-        pre_stage_argv = list(
-            filter(
-                lambda x: not x.startswith('--delete'),
-                [excutable] + options + pre_stage + exclude + [upstream, local],
-            )
-        )
+    upstreams = [upstream] if isinstance(upstream, str) else list(upstream)
+    if not upstreams:
+        raise ValueError('Rsync: no upstream')
+    min_free_bytes = parse_size(min_free)
+    if snapshots:  # published all at once, nothing to delay
+        options = [x for x in options if x != '--delay-updates']
+    preflight_options = [x for x in options if x.startswith(('--timeout', '--ipv'))]
+    # shards only transfer, deletion is done once by the final full pass
+    shard_options = [x for x in options if not x.startswith('--delete')]
 
     def run(self: Task) -> tuple[int, str]:
+        # checked by scheduler, unless set in task config, cleared on reload
+        config = self._config  # pylint: disable=protected-access
+        config.setdefault('local', local)
+        if min_free_bytes:
+            config.setdefault('min_free', min_free_bytes)
+            low = low_space(local, min_free_bytes)
+            if low:
+                log.error(f'Rsync: not starting, {low}')
+                setattr(self, 'fail_class', 'resource')
+                return (-1, '')
+
         if timeout:
             stop_time = datetime.today() + timedelta(seconds=timeout)
             stop_at = [f'--stop-at={stop_time.strftime("%Y-%m-%dT%H:%M")}']
@@ -114,8 +391,7 @@ def Rsync(
             while tries < 50:
                 ret, out = func(self)
                 if ret == 5:
-                    with open(out, encoding='utf-8', errors='ignore') as f:
-                        log_content = f.read()
+                    log_content = read_log(out)
                     if '@ERROR: max connections' in log_content:
                         log.warning('Rsync: hit remote connection limit, retrying')
                         if len(log_content) < 200:
@@ -123,38 +399,228 @@ def Rsync(
                         sleep(10)
                         tries += 1
                         continue
-                elif ret != 0:
-                    log.error(f'Rsync: {EXIT_CODE.get(ret, f"unknown {ret}")}')
-                    return (ret, out)
                 break
+            if ret != 0:
+                log.error(f'Rsync: {EXIT_CODE.get(ret, f"unknown {ret}")}')
+                setattr(self, 'fail_class', classify(ret, out))
             return (ret, out)
 
-        if pre_stage:
-            pre_ret, pre_out = _with_retry(
+        target = local
+
+        def _sync(source: str) -> tuple[int, str, int]:
+            """one attempt from source, with bytes transferred"""
+            nonlocal target
+            marker = None
+            if preflight:
+                marker = fetch_marker(
+                    preflight,
+                    source,
+                    excutable,
+                    preflight_options,
+                    env,
+                    io_timeout or None,
+                )
+                if marker is not None and marker == self.preflight_marker:
+                    log.info('Rsync: upstream marker unchanged, skipping sync')
+                    return (0, '', 0)
+
+            link_dest, inplace = None, False
+            if snapshots:
+                target, link_dest, inplace = prepare(local, reflink)
+
+            def _staged(path: str = '') -> list[str]:
+                return (['--inplace'] if inplace else []) + (
+                    [f'--link-dest={os.path.join(link_dest, path)}']
+                    if link_dest
+                    else []
+                )
+
+            if pre_stage:
+                pre_ret, pre_out = _with_retry(
+                    System(
+                        [
+                            x
+                            for x in [excutable] + options + pre_stage + exclude
+                            if not x.startswith('--delete')
+                        ]
+                        + _staged()
+                        + [source, target]
+                        + stop_at,
+                        log_prefix='rsync-pre',
+                        env=env,
+                        **popen_kwargs,
+                    )
+                )
+                if pre_ret != 0:
+                    return (pre_ret, pre_out, 0)
+
+            run_log = current()
+
+            def _shard(
+                index: int, path: str, shard_exclude: list[str]
+            ) -> tuple[int, str]:
+                # index: sanitized names may collide, with each other or 'pre'
+                name = re.sub(r'[^\w.-]', '_', path)
+                with attach(run_log), shard_slots:
+                    return _with_retry(
+                        System(
+                            [excutable]
+                            + shard_options
+                            + shard_exclude
+                            + _staged(path)
+                            + [source + path + '/', os.path.join(target, path) + '/']
+                            + stop_at,
+                            log_prefix=f'rsync-{index}-{name}',
+                            env=env,
+                            **popen_kwargs,
+                        )
+                    )
+
+            moved = 0
+            if shards:
+                if isinstance(shards, list):
+                    paths = shards
+                else:
+                    paths = list_dirs(
+                        source, excutable, preflight_options, env, io_timeout or None
+                    )
+                filters = {x: shard_filters(exclude, x) for x in paths}
+                excluded = [x for x in paths if filters[x] is None]
+                if excluded:
+                    log.info(f'Rsync: shards excluded {excluded}')
+                paths = [x for x in paths if filters[x] is not None]
+                log.info(f'Rsync: syncing {len(paths)} shards')
+                with ThreadPoolExecutor(
+                    shard_jobs, thread_name_prefix=f'{self.name}-shard'
+                ) as pool:
+                    results = list(
+                        pool.map(
+                            _shard,
+                            range(len(paths)),
+                            paths,
+                            [filters[x] for x in paths],
+                        )
+                    )
+                stats = [transfer_stats(x[1]) for x in results]
+                moved = sum(x[1] for x in stats)
+                log.info(
+                    f'Rsync: shards transferred {sum(x[0] for x in stats)} files, '
+                    f'{moved} bytes'
+                )
+                failed = [x for x in results if x[0] != 0]
+                for ret, out in failed:  # keep local files if anything but partial
+                    if FAIL_CLASS.get(ret) != 'partial':
+                        setattr(self, 'fail_class', classify(ret, out))
+                        return (ret, out, moved)
+
+            # final pass, also top-level files and deletions after shards
+            ret, out = _with_retry(
                 System(
-                    pre_stage_argv + stop_at,
-                    log_prefix='rsync-pre',
+                    [excutable]
+                    + options
+                    + exclude
+                    + _staged()
+                    + [source, target]
+                    + stop_at,
+                    log_prefix='rsync',
                     env=env,
                     **popen_kwargs,
                 )
             )
-            if pre_ret != 0:
-                return (pre_ret, pre_out)
+            if ret != 0:
+                return (ret, out, moved)
+            moved += transfer_stats(out)[1]
+            if shards and failed:
+                setattr(self, 'fail_class', 'partial')
+                return (*failed[0], moved)
+            if marker is not None:
+                setattr(self, 'preflight_marker', marker)
+            return (ret, out, moved)
 
-        ret, out = _with_retry(
-            System(argv + stop_at, log_prefix='rsync', env=env, **popen_kwargs)
-        )
-        if ret != 0:
+        def _note(source: str, **changes: t.Any) -> None:
+            """replace, not mutate, stats as state may be saved meanwhile"""
+            stats = {
+                k: dict(v)
+                for k, v in (self.upstream_stats or {}).items()
+                if k in upstreams
+            }
+            stats.setdefault(source, {}).update(changes)
+            setattr(self, 'upstream_stats', stats)
+
+        order = upstreams
+        if len(upstreams) > 1:
+            now = time()
+            stale = [
+                x
+                for x in upstreams
+                if now - (self.upstream_stats or {}).get(x, {}).get('probed', 0)
+                >= probe_interval
+            ]
+            if stale:
+                with ThreadPoolExecutor(len(stale)) as pool:
+                    latencies = list(
+                        pool.map(
+                            lambda x: probe(
+                                x, excutable, preflight_options, env, probe_timeout
+                            ),
+                            stale,
+                        )
+                    )
+                for source, latency in zip(stale, latencies):
+                    _note(source, latency=latency, probed=now)
+            order = rank_upstreams(upstreams, self.upstream_stats, now)
+            log.info(f'Rsync: upstreams ranked {order}')
+
+        for i, source in enumerate(order):
+            setattr(self, 'fail_class', '')
+            started = monotonic()
+            ret, out, moved = _sync(source)
+            if ret == 0 and out:  # not skipped by preflight
+                record = (self.upstream_stats or {}).get(source, {})
+                changes: dict[str, float] = {
+                    'failed': 0,
+                    'bytes': int(
+                        record.get('bytes', moved) * (1 - THROUGHPUT_WEIGHT)
+                        + moved * THROUGHPUT_WEIGHT
+                    ),
+                }
+                if moved >= MIN_SAMPLE:
+                    bps = moved / max(monotonic() - started, 1e-3)
+                    changes['bps'] = (
+                        record['bps'] * (1 - THROUGHPUT_WEIGHT)
+                        + bps * THROUGHPUT_WEIGHT
+                        if record.get('bps')
+                        else bps
+                    )
+                    log.info(f'Rsync: {source} achieved {int(bps)} bytes/s')
+                _note(source, **changes)
+            if self.fail_class != 'network':
+                break
+            _note(source, failed=time())
+            if i + 1 < len(order):
+                log.warning(
+                    f'Rsync: {source} unreachable, failing over to {order[i + 1]}'
+                )
+        if ret != 0 or not out:
             return (ret, out)
+        if snapshots:
+            try:
+                publish(local, target)
+                prune(local, snapshots)
+            except OSError:
+                log.exception('Rsync: failed publishing snapshot')
+                return (-1, out)
 
         log.debug('Rsync: success')
-
-        if not no_extract_size:
+        if scan_local:
+            scan_task(self, local)
+        elif not no_extract_size:
             try:
-                with open(out, encoding='utf-8', errors='ignore') as f:
-                    match = re.findall(
-                        r'^Total file size: ([0-9]+) bytes', f.read(), re.MULTILINE
-                    )
+                match = re.findall(
+                    r'^Total file size: ([0-9]+) bytes',
+                    read_log(out, STATS_SIZE),
+                    re.MULTILINE,
+                )
                 setattr(self, 'size', int(match[-1]))
                 log.info(f'Rsync: total size {self.size}')
             except (OSError, IndexError, TypeError, ValueError):
@@ -0,0 +1,109 @@
+import typing as t
+import logging as log
+import os
+import re
+import shutil
+import subprocess
+from time import strftime
+
+INCOMPLETE = 'incomplete'  # snapshot being synced, reused after a failed run
+SNAPSHOT = re.compile(r'^\d{8}-\d{6}(?:\.\d+)?$')
+
+
+def snapshot_root(local: str) -> str:
+    """Directory next to local holding its snapshots"""
+    return local.rstrip('/') + '.snapshots'
+
+
+def current(local: str) -> t.Optional[str]:
+    """Snapshot local points to, None if not (yet) a snapshot symlink"""
+    path = local.rstrip('/')
+    if not os.path.islink(path):
+        return None
+    return os.path.realpath(path)
+
+
+def snapshots(root: str) -> list[str]:
+    """Published snapshots, oldest first"""
+    try:
+        names = [x for x in os.listdir(root) if SNAPSHOT.match(x)]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(root, x) for x in sorted(names)]
+
+
+def adopt(local: str) -> None:
+    """Turn a plain local directory into the first snapshot
+
+    The directory is renamed into the snapshot root and replaced by a
+    symlink, so local is missing for a moment, only on the first run.
+    """
+    path = local.rstrip('/')
+    root = snapshot_root(local)
+    os.makedirs(root, exist_ok=True)
+    if os.path.isdir(path) and not os.path.islink(path):
+        first = os.path.join(root, strftime('%Y%m%d-%H%M%S'))
+        log.warning(f'snapshot: moving {path} to {first}')
+        os.rename(path, first)
+        _link(first, path)
+
+
+def prepare(local: str, reflink: bool = False) -> tuple[str, t.Optional[str], bool]:
+    """Directory to sync into, --link-dest directory, whether to sync in place
+
+    Unchanged files are hardlinked from the previous snapshot with
+    --link-dest. With reflink, the previous snapshot is copied with
+    shared extents instead and changed files are updated in place, so
+    only changed blocks are written; falls back to --link-dest if the
+    filesystem has no reflink support.
+    """
+    adopt(local)
+    dest = os.path.join(snapshot_root(local), INCOMPLETE)
+    previous = current(local)
+    if previous is None:
+        return (dest, None, False)
+    # a leftover dest may hold hardlinks to previous, never update it in place
+    if reflink and not os.path.exists(dest):
+        try:
+            subprocess.run(
+                ['cp', '-a', '--reflink=always', previous, dest],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                check=True,
+            )
+            return (dest, None, True)
+        except (OSError, subprocess.SubprocessError):
+            log.warning('snapshot: reflink copy failed, using --link-dest')
+            shutil.rmtree(dest, ignore_errors=True)
+    return (dest, previous, False)
+
+
+def _link(target: str, path: str) -> None:
+    tmp = path + '.tmp'
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    os.symlink(os.path.relpath(target, os.path.dirname(path) or '.'), tmp)
+    os.replace(tmp, path)
+
+
+def publish(local: str, dest: str) -> str:
+    """Rename synced dest to a new snapshot and atomically point local to it"""
+    name = os.path.join(snapshot_root(local), strftime('%Y%m%d-%H%M%S'))
+    snapshot, i = name, 0
+    while os.path.exists(snapshot):
+        i += 1
+        snapshot = f'{name}.{i}'
+    os.rename(dest, snapshot)
+    _link(snapshot, local.rstrip('/'))
+    log.info(f'snapshot: published {snapshot}')
+    return snapshot
+
+
+def prune(local: str, keep: int) -> None:
+    """Remove all but the newest keep snapshots, never the current one"""
+    live = current(local)
+    for path in snapshots(snapshot_root(local))[: -max(keep, 1)]:
+        if os.path.realpath(path) == live:  # live is resolved, e.g. relative local
+            continue
+        log.info(f'snapshot: removing {path}')
+        shutil.rmtree(path, ignore_errors=True)
@@ -2,69 +2,169 @@ import typing as t
 import logging as log
 import os
 import signal
+import threading
+from contextlib import ExitStack
 from subprocess import Popen, PIPE, STDOUT, SubprocessError, TimeoutExpired
 
 from ..daemon import Task, _bind_method
+from .logsink import LogSink, TAIL_SIZE, MIN_CAP
+from ..trace import add, now_us
+
+KILL_GRACE = 10  # seconds between SIGTERM and SIGKILL of a process group
 
 
 def System(
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments,too-many-statements
     cmd: list[str],  # argv
     input_data: t.Optional[bytes] = None,  # stdin data
     timeout: t.Optional[int] = None,  # in seconds, passed to communicate()
     log_prefix: str = 'system',  # passed to task.log_file()
     log_append: bool = False,  # open log file with wb or ab
+    *,
+    log_cap: int = 0,  # bytes of log kept on disk, head and tail, 0 unlimited
+    log_tail: int = 0,  # bytes of log kept in memory as task.log_tail
+    log_compress: bool = False,  # gzip the log file
     **popen_kwargs: t.Any,  # passed to Popen() constructor
 ) -> t.Callable[[Task], tuple[int, str]]:
     """Run command specified with timeout, returns exit code and output"""
+    if 0 < log_cap < MIN_CAP:  # on load rather than on every run
+        raise ValueError(f'System: log_cap below {MIN_CAP} bytes')
 
     def run(self: Task) -> tuple[int, str]:
+        # pylint: disable=too-many-statements,too-many-branches
         if input_data is not None:
             popen_kwargs['stdin'] = PIPE
+        popen_kwargs.setdefault('start_new_session', True)
         log_file = self.log_file(log_prefix)
+        sink = None
+        if log_cap or log_tail or log_compress:
+            sink = LogSink(
+                log_file, log_cap, log_tail or TAIL_SIZE, log_compress, log_append
+            )
+            log_file = sink.path
         log.info(f'System: running {cmd} timeout {timeout}')
         log.debug(f'System: popen_kwargs: {popen_kwargs}')
+        started = now_us()
         try:
-            with Popen(
-                cmd,
-                stdout=open(log_file, 'ab' if log_append else 'wb'),
-                stderr=STDOUT,
-                **popen_kwargs,
-            ) as process:
+            with ExitStack() as stack:
+                if sink:
+                    stack.callback(_close_sink, self, sink)
+                    stdout: t.Any = sink.fd
+                else:
+                    stdout = stack.enter_context(
+                        open(log_file, 'ab' if log_append else 'wb')
+                    )
+                try:
+                    process = stack.enter_context(
+                        Popen(cmd, stdout=stdout, stderr=STDOUT, **popen_kwargs)
+                    )
+                except (FileNotFoundError, PermissionError):
+                    # as exit codes 126 and 127, retrying will not help
+                    setattr(self, 'fail_class', 'fatal')
+                    raise
+                if sink:
+                    sink.start()
                 log.debug(f'System: process pid: {process.pid}')
-                setattr(self, '_system_pid', process.pid)
+                pgid = process.pid if popen_kwargs['start_new_session'] else None
+                # pid -> pgid, several processes may run at once, e.g. shards
+                procs = self.__dict__.setdefault('_system_procs', {})
+                procs[process.pid] = pgid
                 setattr(self, 'kill', _bind_method(self, 'kill', kill_pid))
                 try:
                     process.communicate(input_data, timeout=timeout)
                 except TimeoutExpired:
                     log.warning('System: process timed out, terminating')
-                    process.terminate()
+                    signal_group(process.pid, pgid, signal.SIGTERM)
                     while process.poll() is None:  # keep trying to kill
                         try:
-                            process.wait(timeout=10)
+                            process.wait(timeout=KILL_GRACE)
                         except TimeoutExpired:
                             log.error('System: process did not exit, killing')
-                            process.kill()
-                delattr(self, '_system_pid')
+                            signal_group(process.pid, pgid, signal.SIGKILL)
+                procs.pop(process.pid, None)
                 log.debug('System: process exited')
+                if pgid and group_members(pgid):
+                    log.warning('System: killing orphans left in process group')
+                    signal_group(None, pgid, signal.SIGKILL)
                 if process.returncode != 0:
                     log.error(f'System: process exited with code {process.returncode}')
+                if process.returncode in {126, 127}:  # not executable, not found
+                    setattr(self, 'fail_class', 'fatal')
+                add(
+                    log_prefix,
+                    'system',
+                    started,
+                    now_us(),
+                    {'cmd': cmd[0], 'pid': process.pid, 'code': process.returncode},
+                )
                 return (process.returncode, log_file)
         except (OSError, ValueError, SubprocessError):
             log.exception('System: error executing the command')
+            if not self.fail_class:  # e.g. no space or fds left for the log
+                setattr(self, 'fail_class', 'resource')
             raise
 
     run.__doc__ = f'System({cmd}' + (f', timeout={timeout})' if timeout else ')')
     return run
 
 
-def kill_pid(self: Task) -> bool:
-    pid = getattr(self, '_system_pid', None)
-    if not pid:
-        return False
+def _close_sink(self: Task, sink: LogSink) -> None:
+    sink.close(KILL_GRACE)
+    setattr(self, 'log_tail', sink.tail.decode('utf-8', errors='ignore'))
+
+
+def group_members(pgid: int) -> list[str]:
+    """'pid comm' of live processes in process group"""
+    res = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat', encoding='utf-8', errors='ignore') as f:
+                stat = f.read()
+        except OSError:  # exited
+            continue
+        # pid (comm) state ppid pgrp ..., comm may contain spaces
+        comm = stat[stat.find('(') + 1 : stat.rfind(')')]
+        fields = stat[stat.rfind(')') + 2 :].split()
+        if int(fields[2]) == pgid and fields[0] != 'Z':
+            res.append(f'{pid} {comm}')
+    return res
+
+
+def signal_group(pid: t.Optional[int], pgid: t.Optional[int], sig: int) -> bool:
+    """signal the whole process group if any, or the single process"""
     try:
-        os.kill(pid, signal.SIGTERM)
+        if pgid:
+            os.killpg(pgid, sig)
+        elif pid:
+            os.kill(pid, sig)
         return True
+    except ProcessLookupError:
+        return False
     except OSError:
-        log.exception(f'error killing {pid}')
+        log.exception(f'error sending signal {sig} to {pgid or pid}')
+        return False
+
+
+def kill_pid(self: Task) -> bool:
+    procs = dict(getattr(self, '_system_procs', {}))
+    if not procs:
+        return False
+    killed = []
+    for pid, pgid in procs.items():
+        killed += group_members(pgid) if pgid else [str(pid)]
+    setattr(self, '_killed', killed)  # reported by `stop`
+    sent = [signal_group(pid, pgid, signal.SIGTERM) for pid, pgid in procs.items()]
+    if not any(sent):
         return False
+
+    def escalate() -> None:
+        for pid, pgid in procs.items():
+            if pid in getattr(self, '_system_procs', {}):  # still running
+                log.warning(f'System: {pid} did not exit after SIGTERM, killing')
+                signal_group(pid, pgid, signal.SIGKILL)
+
+    timer = threading.Timer(KILL_GRACE, escalate)
+    timer.name = f'{self.name}-kill'
+    timer.daemon = True
+    timer.start()
+    return True
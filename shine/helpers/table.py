@@ -0,0 +1,72 @@
+import typing as t
+import logging as log
+import os
+import sys
+import csv
+
+from ..daemon import TASKS_DIR, Task
+
+
+def _value(x: str, kind: t.Optional[type]) -> t.Any:
+    """x as the type of the task attribute's default, if a bool or number"""
+    if kind is bool:
+        if x.lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if x.lower() in ('0', 'false', 'no', 'off'):
+            return False
+    elif kind is int:
+        try:
+            return int(x)
+        except ValueError:
+            pass
+    elif kind is float:
+        try:
+            return float(x)
+        except ValueError:
+            pass
+    return x  # left to the loader to report a wrong type
+
+
+def _kinds() -> dict[str, type]:
+    bare = Task()
+    return {
+        attr: type(getattr(bare, attr))
+        for attr in ('on', *Task.CONFIG)
+        if isinstance(getattr(bare, attr), (bool, int, float))
+    }
+
+
+def Table(path: str) -> list[dict[str, t.Any]]:
+    """Rows of a CSV file with header, or tables of a TOML file, for `tasks`
+
+    Relative paths are to the tasks dir. CSV cells are strings, except in
+    columns of bool or numeric task attributes like on or priority, and
+    empty ones are left out to keep defaults. TOML files hold an array of
+    [[tasks]], or one [table] per task name.
+    """
+    path = os.path.join(TASKS_DIR, path)
+    try:
+        if path.endswith('.toml'):
+            # pylint: disable=import-outside-toplevel
+            if sys.version_info >= (3, 11):
+                import tomllib
+            else:  # optional dependency before python 3.11
+                import tomli as tomllib  # type: ignore
+            with open(path, 'rb') as f:
+                data = tomllib.load(f)
+            if isinstance(data.get('tasks'), list):
+                return t.cast(list[dict[str, t.Any]], data['tasks'])
+            return [{'name': k, **v} for k, v in data.items() if isinstance(v, dict)]
+        kinds = _kinds()
+        with open(path, encoding='utf-8', newline='') as f:
+            return [
+                {
+                    k: _value(v.strip(), kinds.get(k))
+                    for k, v in row.items()
+                    if k and v and v.strip()
+                }
+                for row in csv.DictReader(f)
+            ]
+    except (OSError, ValueError):
+        log.error(f'Table: failed reading {path}')
+        raise
@@ -0,0 +1,111 @@
+import typing as t
+import logging as log
+import json
+import threading
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .daemon import HTTP_ADDR, tasks, evt
+from .command import status
+
+# bumped on every state change, cached responses of older generations are stale
+_generation = 0  # pylint: disable=invalid-name
+_cache: dict[str, tuple[int, bytes]] = {}
+_cache_lock = threading.Lock()
+
+METRICS = {  # status field -> (metric name, help)
+    'on': ('shine_task_enabled', 'Whether the task is enabled'),
+    'active': ('shine_task_running', 'Whether the task is running'),
+    'fail_count': ('shine_task_fail_count', 'Consecutive failed runs'),
+    'last_success': (
+        'shine_task_last_success_timestamp_seconds',
+        'Finish time of last successful run',
+    ),
+    'last_finish': ('shine_task_last_finish_timestamp_seconds', 'Last finish time'),
+    'next_sched': ('shine_task_next_sched_timestamp_seconds', 'Next schedule'),
+    'size': ('shine_task_size_bytes', 'Size of the task content'),
+}
+
+
+def _invalidate(event: str, _arg: t.Any) -> None:
+    global _generation  # pylint: disable=global-statement,invalid-name
+    if event.startswith('task:') or event in {':save', ':tasks_load', 'cluster:owners'}:
+        _generation += 1
+
+
+def render_status() -> bytes:
+    # no daemon lock: a snapshot of plain attributes is good enough here
+    return json.dumps([status(task) for task in list(tasks.values())]).encode()
+
+
+def render_metrics() -> bytes:
+    snapshot = [status(task) for task in list(tasks.values())]
+    lines = []
+    for field, (metric, doc) in METRICS.items():
+        lines.append(f'# HELP {metric} {doc}')
+        lines.append(f'# TYPE {metric} gauge')
+        for x in snapshot:
+            if x[field] is not None:
+                name = x['name'].replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{task="{name}"}} {int(x[field])}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def render_task(name: str) -> t.Optional[bytes]:
+    task = tasks.get(name)
+    return json.dumps(status(task)).encode() if task else None
+
+
+def cached(key: str, render: t.Callable[[], t.Optional[bytes]]) -> t.Optional[bytes]:
+    generation = _generation  # before rendering, so races only cause a rerender
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit and hit[0] == generation:
+        return hit[1]
+    body = render()
+    if body is not None:
+        with _cache_lock:
+            _cache[key] = (generation, body)
+    return body
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'shine'
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        path = self.path.split('?', 1)[0]
+        content_type = 'application/json'
+        if path == '/status.json':
+            body = cached(path, render_status)
+        elif path == '/metrics':
+            body = cached(path, render_metrics)
+            content_type = 'text/plain; version=0.0.4'
+        elif path.startswith('/tasks/'):
+            name = unquote(path[len('/tasks/') :])
+            body = cached(path, lambda: render_task(name))
+        else:
+            body = None
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: t.Any) -> None:
+        log.debug(f'{self.address_string()} {format % args}')
+
+
+def httpd() -> None:
+    host, _, port = HTTP_ADDR.rpartition(':')
+    try:
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+    except (OSError, ValueError):
+        log.critical(f'failed serving http on {HTTP_ADDR}!')
+        return
+    evt.watchers.append(_invalidate)
+    log.warning(f'serving on {HTTP_ADDR}')
+    server.serve_forever()
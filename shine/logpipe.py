@@ -0,0 +1,182 @@
+import typing as t
+import logging as log
+import os
+import sys
+import queue
+import threading
+from time import strftime, sleep, monotonic
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+from .daemon import LOG_DIR
+
+if t.TYPE_CHECKING:
+    from .task import Task
+
+LOG_QUEUE = 100_000  # records waiting for the writer thread, dropped beyond
+FLUSH_TIMEOUT = 5  # seconds to wait for queued records on shutdown
+FORMAT = '[%(levelname)s] %(threadName)s: %(message)s'
+RUN_FORMAT = '%(asctime)s [%(levelname)s] %(threadName)s: %(message)s'
+
+# ident of a task thread, or a thread attached to its run -> daemon log file
+runs: dict[int, str] = {}
+
+
+class BraceRecord(log.LogRecord):  # pylint: disable=too-few-public-methods
+    """log.debug('runnables: {}', names) is only formatted if emitted"""
+
+    def getMessage(self) -> str:
+        msg = str(self.msg)
+        if not self.args:
+            return msg
+        if '{' in msg:
+            try:
+                if isinstance(self.args, dict):
+                    return msg.format(**self.args)
+                return msg.format(*self.args)
+            except (IndexError, KeyError, ValueError):
+                pass
+        return msg % self.args  # %-style of other libraries
+
+
+class DroppingQueueHandler(QueueHandler):
+    """never blocks the logging thread, counts records dropped on a full queue"""
+
+    def __init__(self, q: 'queue.Queue[t.Any]') -> None:
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: log.LogRecord) -> log.LogRecord:
+        # resolved now, the run may have ended when the writer gets to it
+        setattr(record, 'run_log', runs.get(record.thread or 0))
+        prepared: log.LogRecord = super().prepare(record)
+        return prepared
+
+    def enqueue(self, record: log.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.handle(
+                log.makeLogRecord(
+                    {
+                        'levelno': log.WARNING,
+                        'levelname': 'WARNING',
+                        'threadName': 'log',
+                        'msg': f'dropped {dropped} log records, output too slow',
+                    }
+                )
+            )
+
+
+class RunLogHandler(log.Handler):
+    """records of task threads, and threads attached to their run, to runs"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._files: dict[str, t.IO[str]] = {}
+
+    def emit(self, record: log.LogRecord) -> None:
+        if hasattr(record, 'run_log'):  # queued
+            path = record.run_log
+        else:  # written directly
+            path = runs.get(record.thread or 0)
+        live = set(runs.values())
+        if len(self._files) > len(live):  # close logs of finished runs
+            for old in [x for x in self._files if x not in live]:
+                self._files.pop(old).close()
+        if path is None:
+            return
+        try:
+            f = self._files.get(path)
+            if f is None:
+                # pylint: disable=consider-using-with
+                f = self._files[path] = open(path, 'a', encoding='utf-8')
+            f.write(self.format(record) + '\n')
+            f.flush()  # nothing buffered to be written twice by forked workers
+        except OSError:
+            self.handleError(record)
+
+
+_handlers: list[log.Handler] = []
+_queue: 'queue.Queue[t.Any]' = queue.Queue(LOG_QUEUE)
+
+
+def _new_handlers(stream: t.IO[str]) -> list[log.Handler]:
+    stderr = log.StreamHandler(stream)
+    stderr.setFormatter(log.Formatter(FORMAT))
+    run_log = RunLogHandler()
+    run_log.setFormatter(log.Formatter(RUN_FORMAT))
+    return [stderr, run_log]
+
+
+def _direct() -> None:
+    """write from the calling thread, after stop()"""
+    root = log.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in _handlers:
+        root.addHandler(handler)
+
+
+def _forked() -> None:
+    """write directly from a forked worker, through files of its own: the
+    writer thread may have held the buffer lock of stderr or of a run log
+    at fork, which nothing in the child would ever release"""
+    # pylint: disable-next=consider-using-with
+    stream = open(os.dup(sys.stderr.fileno()), 'w', encoding='utf-8', buffering=1)
+    _handlers[:] = _new_handlers(stream)
+    _direct()
+
+
+def setup(level: int) -> None:
+    """one writer thread for all output, to stderr and per task run logs"""
+    log.setLogRecordFactory(BraceRecord)
+    _handlers[:] = _new_handlers(sys.stderr)
+    root = log.getLogger()
+    root.setLevel(level)
+    root.addHandler(DroppingQueueHandler(_queue))
+    QueueListener(_queue, *_handlers).start()
+    os.register_at_fork(after_in_child=_forked)
+
+
+def stop() -> None:
+    """flush queued records unless output is stuck, write later ones directly"""
+    deadline = monotonic() + FLUSH_TIMEOUT
+    while _queue.unfinished_tasks and monotonic() < deadline:
+        sleep(0.01)
+    _direct()
+
+
+def begin(task: 'Task') -> None:
+    path = os.path.join(LOG_DIR, f'daemon-{task.name}-{strftime("%Y%m%d-%H%M%S")}.log')
+    runs[threading.get_ident()] = path
+    setattr(task, 'daemon_log', path)
+
+
+def end(_task: 'Task') -> None:
+    runs.pop(threading.get_ident(), None)
+
+
+def current() -> t.Optional[str]:
+    """run log of the calling thread, for threads it starts to attach()"""
+    return runs.get(threading.get_ident())
+
+
+@contextmanager
+def attach(path: t.Optional[str]) -> t.Iterator[None]:
+    """log the calling thread to the run log path too, e.g. shards of a run"""
+    ident = threading.get_ident()
+    previous = runs.get(ident)
+    if path:
+        runs[ident] = path
+    try:
+        yield
+    finally:
+        if previous:
+            runs[ident] = previous
+        else:
+            runs.pop(ident, None)
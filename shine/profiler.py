@@ -0,0 +1,73 @@
+import typing as t
+import logging as log
+import threading
+from time import monotonic
+from contextlib import contextmanager
+
+# seconds, warn on hooks slower than this
+slow = 1.0  # pylint: disable=invalid-name
+
+
+class HookStat:  # pylint: disable=too-few-public-methods
+    __slots__ = ('calls', 'total', 'max', 'last', 'timeouts', 'errors')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.timeouts = 0
+        self.errors = 0
+
+    def dump(self) -> dict[str, t.Any]:
+        return {
+            **{attr: getattr(self, attr) for attr in HookStat.__slots__},
+            'avg': self.total / self.calls if self.calls else 0.0,
+        }
+
+
+# hook name -> timing, e.g. 'condition <task>' or '<event> <handler>'
+stats: dict[str, HookStat] = {}
+_lock = threading.Lock()
+
+
+def record(
+    hook: str, elapsed: float, timeout: bool = False, error: bool = False
+) -> None:
+    with _lock:
+        stat = stats.setdefault(hook, HookStat())
+        if timeout:  # still running, the elapsed time is only a lower bound
+            stat.timeouts += 1
+        else:
+            stat.calls += 1
+            stat.total += elapsed
+            stat.last = elapsed
+        stat.max = max(stat.max, elapsed)
+        stat.errors += error
+    if elapsed > slow and not timeout:
+        log.warning(f'slow hook {hook}: {elapsed:.3f}s')
+
+
+@contextmanager
+def timed(hook: str) -> t.Iterator[None]:
+    start = monotonic()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        record(hook, monotonic() - start, error=error)
+
+
+def hook_name(f: t.Callable[..., t.Any]) -> str:
+    return getattr(f, '__qualname__', None) or repr(f)
+
+
+def report(limit: int = 20) -> list[dict[str, t.Any]]:
+    """slowest hooks first"""
+    with _lock:
+        res = [{'hook': k, **v.dump()} for k, v in stats.items()]
+    res.sort(key=lambda x: (x['timeouts'], x['max']), reverse=True)
+    return res[:limit] if limit else res
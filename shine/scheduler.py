@@ -1,10 +1,116 @@
+import typing as t
 import logging as log
 import threading
-from time import time, sleep
+from time import time, sleep, monotonic, ctime
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as Timeout
 
-from .daemon import evt, tasks, lock, save
+from .daemon import SCHED_POLICY, Task, evt, tasks, lock, save, stopping, open_at
+from .profiler import timed, record
+from .cluster import owns
+from .health import pressure, low_space
+from .fairshare import fair
 
 interval = 10  # pylint: disable=invalid-name
+condition_workers = 8  # pylint: disable=invalid-name
+
+_conditions = ThreadPoolExecutor(condition_workers, thread_name_prefix='condition')
+_pending: dict[str, Future[bool]] = {}  # conditions still running, by task name
+_cached: dict[str, tuple[float, bool]] = {}  # task name -> (expiry, result)
+_low: set[str] = set()  # tasks held for disk space
+_blackout: dict[str, int] = {}  # task name -> end of the blackout holding it
+# task reloads so far, see conditions()
+_loads = 0  # pylint: disable=invalid-name
+
+
+def _condition(task: Task) -> bool:
+    with timed(f'condition {task.name}'):
+        return bool(task.condition())
+
+
+def _forget(event: str, _arg: t.Any) -> None:
+    global _loads  # pylint: disable=global-statement,invalid-name
+    if event == ':tasks_load':  # conditions may have changed
+        _loads += 1  # before clearing, see conditions()
+        _cached.clear()
+        _blackout.clear()  # and blackouts, cleared with plugins
+        _pending.clear()  # results of running ones are dropped, see conditions()
+
+
+def conditions(runnables: list[Task]) -> list[Task]:
+    """filter by custom conditions, run concurrently without the daemon lock
+
+    A condition not done within its task's condition_timeout counts as
+    False for this slot, it is not started again until it finishes, and
+    its late result is used by the next slot, unless tasks were reloaded
+    meanwhile.
+    """
+    start = monotonic()
+    loads = _loads
+    results: dict[str, bool] = {}
+    futures: dict[str, Future[bool]] = {}
+    for task in runnables:
+        cached = _cached.get(task.name)
+        if 'condition' not in task.__dict__:  # default, always True
+            results[task.name] = True
+        elif cached and cached[0] > start:
+            results[task.name] = cached[1]
+        else:
+            if task.name not in _pending:
+                _pending[task.name] = _conditions.submit(_condition, task)
+            futures[task.name] = _pending[task.name]
+    for task in sorted(runnables, key=lambda x: x.condition_timeout):
+        if task.name in results:
+            continue
+        future = futures[task.name]
+        try:
+            results[task.name] = future.result(
+                max(0, start + task.condition_timeout - monotonic())
+            )
+        except Timeout:
+            log.warning(f'condition of {task.name} timed out')
+            record(f'condition {task.name}', monotonic() - start, timeout=True)
+            results[task.name] = False
+            continue
+        # _forget() may run in the reload thread at any point here
+        if _pending.pop(task.name, None) is not future or _loads != loads:
+            results[task.name] = False  # of a config before reload
+            continue
+        if task.condition_ttl:
+            _cached[task.name] = (monotonic() + task.condition_ttl, results[task.name])
+            if _loads != loads:  # cleared just before written
+                _cached.pop(task.name, None)
+    return [task for task in runnables if results[task.name]]
+
+
+def due(now: int) -> list[Task]:
+    """enabled, idle and due tasks of this node not held by disk space or blackout"""
+    res = []
+    for task in tasks.values():
+        if not task.on or task.active or task.next_sched > now + interval:
+            continue
+        if not owns(task.name):  # leased by another node
+            continue
+        try:
+            low = low_space(task.local, task.min_free)
+        except (TypeError, ValueError):  # set by a runner, not checked on load
+            low = f'invalid min_free {task.min_free!r}'
+        if low and task.name not in _low:  # log on changes only
+            log.warning(f'holding {task.name}, {low}')
+        _low.discard(task.name)
+        if low:
+            _low.add(task.name)
+            continue
+        # next_sched is kept, so is lateness for the priority after the blackout
+        opening = _blackout.get(task.name, 0)
+        if opening <= now:  # no polling until the blackout ends
+            opening = open_at(task.group, now)
+            if opening > now:
+                log.info(f'{task.name} held by blackout until {ctime(opening)}')
+                _blackout[task.name] = opening
+        if opening > now:
+            continue
+        res.append(task)
+    return res
 
 
 def sched() -> None:
@@ -17,38 +123,54 @@ def sched() -> None:
                 task.last_finish = int(time())
                 task.next_sched = int(time())
         save()
+    held_by: t.Optional[str] = None  # reason new starts are held
+    evt.watchers.append(_forget)
+    evt.watchers.append(fair.watch)  # usage is tracked with any policy
     evt('sched:load')
     log.warning('started')
     while True:
         # sleep for a while
         sleep(interval)
+        if stopping.is_set():
+            continue
+        held = pressure()
+        if held != held_by:  # log on changes only
+            log.warning(f'holding new starts, {held}' if held else 'resuming starts')
+            held_by = held
+        if held:
+            continue
         with lock:
             log.debug('schedule slot')
             evt('sched:pre')
             # check runnable tasks
             log.debug('checking runnables')
-            runnables = [  # filter by trivial criteria
+            runnables = due(int(time()))  # filter by trivial criteria
+            evt('sched:runnables', runnables)  # filter by plugins
+        runnables = conditions(runnables)  # filter by custom condition
+        with lock:
+            runnables = [  # may have changed while checking conditions
                 task
-                for task in tasks.values()
+                for task in runnables
                 if task.on
                 and not task.active
-                and task.next_sched <= int(time()) + interval
-            ]
-            evt('sched:runnables', runnables)  # filter by plugins
-            runnables = [  # filter by custom condition
-                task for task in runnables if task.condition()
+                and tasks.get(task.name) is task
+                and owns(task.name)
             ]
-            log.debug(f'runnables: {[ task.name for task in runnables ]}')
+            if log.root.isEnabledFor(log.DEBUG):
+                log.debug('runnables: {}', [task.name for task in runnables])
             if not runnables:
                 continue
             # select a runnable
             evt('sched:select', locals())
-            next_task = max(
-                runnables,
-                key=lambda t: (t.priority or 1.0) * (time() + interval - t.next_sched),
-            )
-            log.debug(f'next_task: {next_task.name}')
-            save()
+            if SCHED_POLICY == 'fairshare':
+                next_task = fair.pick(runnables) or runnables[0]
+            else:
+                next_task = max(
+                    runnables,
+                    key=lambda t: t.priority * (time() + interval - t.next_sched),
+                )
+            log.debug('next_task: {}', next_task.name)
+            save(next_task)
             # start the task
             threading.Thread(target=next_task.thread, name=next_task.name).start()
             log.debug('new task started')
@@ -0,0 +1,121 @@
+import typing as t
+import logging as log
+import os
+import threading
+import tracemalloc
+from time import time
+from collections import deque
+
+from .daemon import SELFMON_INTERVAL, MAX_RSS_GROWTH, MAX_FD_GROWTH
+from .daemon import MAX_THREAD_GROWTH, tasks, stopping
+from .health import parse_size
+
+HISTORY = 288  # samples kept, a day at the default interval
+WINDOW = 12  # growth is of the lowest of this many recent samples
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Sample(t.NamedTuple):
+    time: float
+    rss: int  # bytes
+    threads: int
+    fds: int
+    tasks: int
+    active: int  # running tasks
+
+
+history: deque[Sample] = deque(maxlen=HISTORY)
+baseline: t.Optional[Sample] = None  # pylint: disable=invalid-name
+_warned: set[str] = set()
+_snapshot: t.Optional[tracemalloc.Snapshot] = None  # pylint: disable=invalid-name
+
+
+def _rss_limit() -> int:
+    try:
+        return parse_size(MAX_RSS_GROWTH)
+    except ValueError:
+        log.warning(f'invalid MAX_RSS_GROWTH {MAX_RSS_GROWTH!r}, e.g. 512M, ignored')
+        return 0
+
+
+rss_limit = _rss_limit()  # pylint: disable=invalid-name
+
+
+def sample() -> Sample:
+    with open('/proc/self/statm', encoding='utf-8') as f:
+        rss = int(f.read().split()[1]) * PAGE_SIZE
+    return Sample(
+        time(),
+        rss,
+        threading.active_count(),
+        len(os.listdir('/proc/self/fd')),
+        len(tasks),
+        sum(x.active for x in list(tasks.values())),
+    )
+
+
+def limits() -> dict[str, int]:
+    """growth warned about, 0 for no limit"""
+    return {
+        'rss': rss_limit,
+        'threads': MAX_THREAD_GROWTH,
+        'fds': MAX_FD_GROWTH,
+    }
+
+
+def growth() -> dict[str, int]:
+    """lowest of recent samples over baseline, running tasks hold resources
+    only for a while, leaked ones stay"""
+    recent = list(history)[-WINDOW:]
+    if baseline is None or not recent:
+        return {}
+    return {
+        key: min(getattr(x, key) for x in recent) - getattr(baseline, key)
+        for key in limits()
+    }
+
+
+def check(current: Sample) -> None:
+    global baseline  # pylint: disable=global-statement,invalid-name
+    if baseline is None:
+        baseline = current
+    history.append(current)
+    if len(history) < WINDOW:
+        return
+    grown = growth()
+    for key, limit in limits().items():
+        if limit and grown[key] > limit:
+            if key not in _warned:  # once until back under the limit
+                log.warning(f'{key} grew by {grown[key]} since start, over {limit}')
+                _warned.add(key)
+        else:
+            _warned.discard(key)
+
+
+def top(limit: int = 10) -> t.Optional[list[str]]:
+    """allocations grown most since tracing started, None when just started"""
+    global _snapshot  # pylint: disable=global-statement,invalid-name
+    if not tracemalloc.is_tracing() or _snapshot is None:
+        tracemalloc.start()
+        _snapshot = tracemalloc.take_snapshot()
+        log.warning('tracemalloc started, memory use and allocations get slower')
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    return [str(x) for x in snapshot.compare_to(_snapshot, 'lineno')[:limit]]
+
+
+def stop_tracing() -> None:
+    global _snapshot  # pylint: disable=global-statement,invalid-name
+    tracemalloc.stop()
+    _snapshot = None
+
+
+def selfmon() -> None:
+    check(sample())
+    while not stopping.wait(SELFMON_INTERVAL):
+        try:
+            check(sample())
+        except OSError:
+            log.exception('failed sampling self')
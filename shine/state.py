@@ -0,0 +1,146 @@
+import typing as t
+import logging as log
+import os
+import json
+import sqlite3
+import threading
+from time import time
+
+from .task import Task, STATE_VERSION
+
+HISTORY_RUNS = 1000  # runs kept per task, older ones pruned on record
+
+
+class JsonStore:
+    """whole state in a single JSON file, rewritten on every save"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> list[dict[str, t.Any]]:
+        with open(self.path, 'rb') as f:
+            state = json.load(f)
+        if isinstance(state, list):  # unversioned
+            state = {'version': 0, 'tasks': state}
+        if state['version'] > STATE_VERSION:
+            raise ValueError(f'unsupported state version {state["version"]}')
+        return t.cast(list[dict[str, t.Any]], state['tasks'])
+
+    def save(self, tasks: dict[str, Task], _task: t.Optional[Task] = None) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'version': STATE_VERSION,
+                    'tasks': [task.dump() for task in tasks.values()],
+                },
+                f,
+                default=lambda _: None,
+                skipkeys=True,
+            )
+
+    def record(self, _task: Task, _result: bool) -> None:
+        pass  # no run history
+
+    def history(self, _name: str, _limit: int = 10) -> list[dict[str, t.Any]]:
+        return []
+
+
+class SqliteStore:
+    """one row per task updated on transitions, with run history"""
+
+    def __init__(self, path: str, migrate_from: t.Optional[str] = None) -> None:
+        self.path = path
+        self.migrate_from = migrate_from
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                task TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                finish INTEGER NOT NULL,
+                result INTEGER NOT NULL,
+                fail_class TEXT NOT NULL,
+                size INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS runs_task_finish ON runs (task, finish);
+            ''')
+
+    def _migrate(self) -> list[dict[str, t.Any]]:
+        if not self.migrate_from or not os.path.exists(self.migrate_from):
+            return []
+        log.warning(f'migrating state from {self.migrate_from} to {self.path}')
+        state = JsonStore(self.migrate_from).load()
+        self._write([Task(x).dump() for x in state], replace=True)
+        os.rename(self.migrate_from, self.migrate_from + '.migrated')
+        return state
+
+    def load(self) -> list[dict[str, t.Any]]:
+        with self._lock:
+            rows = self._db.execute('SELECT version, state FROM tasks').fetchall()
+            if not rows:
+                return self._migrate()
+        if any(version > STATE_VERSION for version, _ in rows):
+            raise ValueError('unsupported state version')
+        return [json.loads(state) for _, state in rows]
+
+    def _write(self, states: list[dict[str, t.Any]], replace: bool = False) -> None:
+        rows = [
+            (x['name'], STATE_VERSION, json.dumps(x, default=lambda _: None))
+            for x in states
+        ]
+        self._db.execute('BEGIN')
+        try:
+            if replace:
+                self._db.execute('DELETE FROM tasks')
+            self._db.executemany('REPLACE INTO tasks VALUES (?, ?, ?)', rows)
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            raise
+
+    def save(self, tasks: dict[str, Task], task: t.Optional[Task] = None) -> None:
+        with self._lock:
+            if task is not None:
+                self._write([task.dump()])
+            else:
+                self._write([x.dump() for x in tasks.values()], replace=True)
+
+    def record(self, task: Task, result: bool) -> None:
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    task.name,
+                    task.last_start,
+                    int(time()),
+                    int(result),
+                    task.fail_class,
+                    task.size,
+                ),
+            )
+            self._db.execute(
+                '''DELETE FROM runs WHERE task = ? AND rowid < (
+                    SELECT rowid FROM runs WHERE task = ?
+                    ORDER BY rowid DESC LIMIT 1 OFFSET ?
+                )''',
+                (task.name, task.name, HISTORY_RUNS - 1),
+            )
+
+    def history(self, name: str, limit: int = 10) -> list[dict[str, t.Any]]:
+        with self._lock:
+            cursor = self._db.execute(
+                'SELECT * FROM runs WHERE task = ? ORDER BY finish DESC LIMIT ?',
+                (name, limit),
+            )
+            columns = [x[0] for x in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+StateStore = t.Union[JsonStore, SqliteStore]
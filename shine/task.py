@@ -3,13 +3,38 @@ import logging as log
 import os
 import threading
 from time import time, strftime, localtime
+from random import uniform
 
-from .daemon import LOG_DIR, evt, save, lock
+from .daemon import LOG_DIR, evt, save, record, lock, run_in_process
+from .trace import span, add, now_us
+from .logpipe import begin, end
 
+STATE_VERSION = 1  # bump on incompatible changes to TaskState
+
+
+class TaskState:
+    """persistent scheduling state with a fixed schema, see dump() and load()"""
 
-class Task:
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, _dict: t.Optional[dict[str, t.Any]] = None) -> None:
+
+    __slots__ = (
+        'name',
+        'on',
+        'last_success',
+        'last_start',
+        'last_finish',
+        'next_sched',
+        'fail_count',
+        'fatal_count',
+        'fail_class',
+        'size',
+        'file_count',
+        'preflight_marker',
+        'upstream_stats',
+        'fair_usage',
+    )
+
+    def __init__(self) -> None:
         self.name: str = ''  # required in config
         self.on: bool = True
         self.last_success: int = 0
@@ -17,9 +42,60 @@ class Task:
         self.last_finish: int = 0
         self.next_sched: int = 0
         self.fail_count: int = 0
+        self.fatal_count: int = 0  # fatal failures in a row, see fatal_limit
+        self.fail_class: str = ''  # set by runner on failure, see retry()
+        self.size: t.Optional[int] = None
+        self.file_count: t.Optional[int] = None
+        self.preflight_marker: t.Optional[str] = None
+        # upstream -> latency, throughput and failure record, see helpers.Rsync
+        self.upstream_stats: dict[str, dict[str, t.Any]] = {}
+        # decayed runtime in seconds as of time, see fairshare.FairShare
+        self.fair_usage: dict[str, float] = {}
+
+    def dump(self) -> dict[str, t.Any]:
+        return {attr: getattr(self, attr) for attr in TaskState.__slots__}
+
+    def load(self, state: dict[str, t.Any]) -> None:
+        for attr in TaskState.__slots__:
+            if attr in state:
+                setattr(self, attr, state[attr])
+
+
+class Task(TaskState):
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ('_thread', '_config', '_loaded', '_log', '__dict__')
+
+    # typed config, may set in config, reset to default on reload
+    CONFIG: t.ClassVar[tuple[str, ...]] = (
+        'executor',
+        'priority',
+        'retry_base',
+        'retry_cap',
+        'retry_partial',
+        'partial_retries',
+        'fatal_limit',
+        'condition_timeout',
+        'condition_ttl',
+        'group',
+    )
+    executor: str = 'thread'  # or 'process' to run in a worker process
+    priority: float = 1.0
+    retry_base: int = 30
+    retry_cap: int = 24 * 60 * 60
+    retry_partial: int = 60
+    partial_retries: int = 2  # quick retries of a partial run, then backoff
+    fatal_limit: int = 3  # disable after this many fatal failures in a row
+    condition_timeout: float = 5.0  # condition() taking longer counts as False
+    condition_ttl: float = 0.0  # seconds a condition() result is reused
+    group: str = ''  # for blackouts of a group of tasks, see windows.blackout()
+
+    def __init__(self, _dict: t.Optional[dict[str, t.Any]] = None) -> None:
+        super().__init__()
         self._thread: t.Optional[threading.Thread] = None
-        self.__dict__.update(_dict or {})
         self._config: dict[str, t.Any] = {}
+        self._loaded = False
+        self._log: t.Optional[str] = None  # last log_file(), see `follow`
+        self.load(_dict or {})
 
     @property
     def active(self) -> bool:
@@ -45,7 +121,8 @@ class Task:
         file_name = f'{self.name}-{strftime("%Y%m%d-%H%M%S")}.log'
         if prefix and isinstance(prefix, str):
             file_name = prefix + '-' + file_name
-        return os.path.join(LOG_DIR, file_name)
+        self._log = os.path.join(LOG_DIR, file_name)
+        return self._log
 
     # * task runner
     def run(self) -> bool:
@@ -60,8 +137,14 @@ class Task:
     # + custom next() retry for failed run
     def retry(self) -> int:
         normal = self.next()
-        failed = int(time()) + (self.retry_base or 30) * int(2**self.fail_count)
-        return min(normal, failed)
+        # most files done, finish them soon, unless it keeps failing
+        if self.fail_class == 'partial' and self.fail_count < self.partial_retries:
+            delay = self.retry_partial
+        else:
+            delay = min(self.retry_base * int(2**self.fail_count), self.retry_cap)
+            if self.fail_class == 'network':  # spread reconnects to upstream
+                delay = int(delay * uniform(0.75, 1.25))
+        return min(normal, int(time()) + delay)
 
     # + method to stop the task
     def kill(self) -> bool:
@@ -80,43 +163,76 @@ class Task:
         pass
 
     # task controller, do NOT override
-    def thread(self) -> None:
+    def thread(self) -> None:  # pylint: disable=too-many-statements
         log.info('task started')
+        started = now_us()
         with lock:
             if self.active:  # exclusive
                 return
             self._thread = threading.current_thread()
             self.last_start = int(time())
-            save()
-        evt('task:pre', self)
-        log.debug('task pre()')
-        self.pre()
-        log.debug('task run()')
-        result = self.run()
-        log.debug('task post()')
-        self.post(result)
-        evt('task:post', self)
-        with lock:
-            if result:
-                self.last_success = int(time())
-                self.next_sched = self.next()
-                self.fail_count = 0
-                log.debug('task success()')
-                self.success()
-                evt('task:success', self)
-                log.info('task succeeded')
+            self.fail_class = ''
+            save(self)
+        begin(self)
+        try:
+            if 0 < self.next_sched < self.last_start:
+                late = self.last_start - self.next_sched
+                add(
+                    'queued',
+                    'sched',
+                    started - late * 1_000_000,
+                    started,
+                    {'late': late},
+                )
+            evt('task:pre', self)
+            if self.executor == 'process':
+                log.debug('task run_in_process()')
+                with span('run', executor='process'):
+                    result = run_in_process(self)
             else:
-                self.next_sched = self.retry()
-                self.fail_count += 1
-                log.debug('task fail()')
-                self.fail()
-                evt('task:fail', self)
-                log.info(f'task failed({self.fail_count})')
-            log.info(
-                'next schedule '
-                f'{strftime("%Y-%m-%d %H:%M:%S", localtime(self.next_sched))}'
-            )
-            self.last_finish = int(time())
-            self._thread = None
-            save()
-        log.debug('task ended')
+                log.debug('task pre()')
+                with span('pre'):
+                    self.pre()
+                log.debug('task run()')
+                with span('run'):
+                    result = self.run()
+                log.debug('task post()')
+                with span('post'):
+                    self.post(result)
+            evt('task:post', self)
+            with lock:
+                if result:
+                    self.last_success = int(time())
+                    self.next_sched = self.next()
+                    self.fail_count = 0
+                    self.fatal_count = 0
+                    log.debug('task success()')
+                    self.success()
+                    evt('task:success', self)
+                    log.info('task succeeded')
+                else:
+                    self.next_sched = self.retry()
+                    self.fail_count += 1
+                    fatal = self.fail_class == 'fatal'
+                    self.fatal_count = self.fatal_count + 1 if fatal else 0
+                    if fatal and self.fatal_count >= self.fatal_limit:
+                        log.error(
+                            f'disabling task after {self.fatal_count} fatal failures'
+                        )
+                        self.on = False
+                    log.debug('task fail()')
+                    self.fail()
+                    evt('task:fail', self)
+                    log.info(f'task failed({self.fail_count})')
+                log.info(
+                    'next schedule '
+                    f'{strftime("%Y-%m-%d %H:%M:%S", localtime(self.next_sched))}'
+                )
+                self.last_finish = int(time())
+                self._thread = None
+                record(self, bool(result))
+                save(self)
+            add(self.name, 'task', started, now_us(), {'result': bool(result)})
+            log.debug('task ended')
+        finally:
+            end(self)
@@ -0,0 +1,91 @@
+import typing as t
+import os
+import threading
+from time import time_ns
+from collections import deque
+from contextlib import nullcontext
+
+from .daemon import TRACE_SPANS
+
+# (name, category, start µs, duration µs, thread ident, thread name, args)
+Span = tuple[str, str, int, int, int, str, t.Optional[dict[str, t.Any]]]
+
+# appends and copies of a deque are atomic, no lock needed
+spans: deque[Span] = deque(maxlen=TRACE_SPANS or 1)
+_NULL = nullcontext()
+
+
+def now_us() -> int:
+    return time_ns() // 1000
+
+
+def add(
+    name: str,
+    category: str,
+    start: int,
+    end: int,
+    args: t.Optional[dict[str, t.Any]] = None,
+) -> None:
+    """record a span of the current thread, start and end from now_us()"""
+    if not TRACE_SPANS:
+        return
+    thread = threading.current_thread()
+    spans.append(
+        (name, category, start, end - start, thread.ident or 0, thread.name, args)
+    )
+
+
+class _Span:
+    """context recording its block, cheaper than a generator based one"""
+
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(
+        self, name: str, category: str, args: t.Optional[dict[str, t.Any]]
+    ) -> None:
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self) -> None:
+        self.start = now_us()
+
+    def __exit__(self, *_: t.Any) -> None:
+        add(self.name, self.category, self.start, now_us(), self.args)
+
+
+def span(name: str, category: str = 'task', **args: t.Any) -> t.ContextManager[t.Any]:
+    """record the with block, a shared no-op context when tracing is off"""
+    if not TRACE_SPANS:
+        return _NULL
+    return _Span(name, category, args or None)
+
+
+def export(since: float = 0.0) -> dict[str, t.Any]:
+    """spans started after since, in Chrome trace event format"""
+    pid = os.getpid()
+    cutoff = int(since * 1e6)
+    events: list[dict[str, t.Any]] = []
+    threads: dict[int, str] = {}
+    for name, category, start, duration, tid, thread, args in spans.copy():
+        if start < cutoff:
+            continue
+        threads[tid] = thread  # latest name, idents are reused by new threads
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start,
+            'dur': duration,
+            'pid': pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        events.append(event)
+    events += [
+        {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': x}}
+        for tid, x in threads.items()
+    ]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,153 @@
+import typing as t
+import logging as log
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+WEEK = 7 * 24 * 60 * 60
+DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+WEEKLY = re.compile(
+    r'^(?:(?P<days>[a-z,-]+)\s+)?(?P<start>\d+:\d\d)-(?P<end>\d+:\d\d)$'
+)
+
+
+def _merge(spans: list[tuple[int, int]]) -> tuple[list[int], list[int]]:
+    """sorted, non-overlapping (starts, ends) of spans"""
+    starts: list[int] = []
+    ends: list[int] = []
+    for start, end in sorted(spans):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return (starts, ends)
+
+
+def _days(spec: str) -> list[int]:
+    days: list[int] = []
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        start = DAYS.index(first[:3])
+        end = DAYS.index(last[:3]) if last else start
+        days += [x % 7 for x in range(start, end + 7 * (end < start) + 1)]
+    return days
+
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = (int(x) for x in hhmm.split(':'))
+    if not (0 <= hours and 0 <= minutes < 60 and hours * 60 + minutes <= 24 * 60):
+        raise ValueError(f'invalid time {hhmm}')
+    return hours * 60 + minutes
+
+
+def _week_start(ts: float) -> datetime:
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
+
+class Calendar:
+    """Blackout periods, compiled to sorted disjoint spans for bisect lookups
+
+    Weekly spans are seconds since Monday 00:00 local time, absolute spans
+    are timestamps.
+    """
+
+    def __init__(self) -> None:
+        self.specs: list[str] = []
+        self._weekly: list[tuple[int, int]] = []
+        self._absolute: list[tuple[int, int]] = []
+        self._compiled: t.Optional[tuple[list[int], ...]] = None
+
+    def add(self, spec: str) -> None:
+        weekly: list[tuple[int, int]] = []
+        match = WEEKLY.match(spec.strip().lower())
+        if match:
+            start = _minutes(match['start']) * 60
+            end = _minutes(match['end']) * 60
+            if end <= start:  # across midnight
+                end += 24 * 60 * 60
+            for day in _days(match['days']) if match['days'] else range(7):
+                offset = day * 24 * 60 * 60
+                if offset + end > WEEK:  # across the end of week
+                    weekly.append((0, offset + end - WEEK))
+                weekly.append((offset + start, min(offset + end, WEEK)))
+            if _merge(self._weekly + weekly) == ([0], [WEEK]):
+                raise ValueError(f'blackout covers the whole week: {spec}')
+            self._weekly += weekly
+        else:
+            first, _, last = (x.strip() for x in spec.partition(' - '))
+            start_dt = datetime.fromisoformat(first)
+            end_dt = datetime.fromisoformat(last or first)
+            if len(last or first) <= 10:  # date only, whole day
+                end_dt += timedelta(days=1)
+            if end_dt <= start_dt:
+                raise ValueError(f'blackout ends before it starts: {spec}')
+            self._absolute.append((int(start_dt.timestamp()), int(end_dt.timestamp())))
+        self.specs.append(spec)
+        self._compiled = None
+
+    def _compile(self) -> tuple[list[int], ...]:
+        if self._compiled is None:
+            self._compiled = (*_merge(self._weekly), *_merge(self._absolute))
+        return self._compiled
+
+    def blocked_until(self, ts: int) -> t.Optional[int]:
+        """End of the blackout span ts is in, if any"""
+        weekly_starts, weekly_ends, starts, ends = self._compile()
+        i = bisect_right(starts, ts) - 1
+        if i >= 0 and ends[i] > ts:
+            return ends[i]
+        week = _week_start(ts)
+        offset = int(ts - week.timestamp())
+        i = bisect_right(weekly_starts, offset) - 1
+        if i >= 0 and weekly_ends[i] > offset:
+            return int((week + timedelta(seconds=weekly_ends[i])).timestamp())
+        return None
+
+    def upcoming(self, ts: int, horizon: int = WEEK) -> list[tuple[int, int]]:
+        """Blackout spans overlapping [ts, ts + horizon)"""
+        weekly_starts, weekly_ends, starts, ends = self._compile()
+        spans = [(s, e) for s, e in zip(starts, ends) if e > ts and s < ts + horizon]
+        week = _week_start(ts)
+        while week.timestamp() < ts + horizon:
+            for start, end in zip(weekly_starts, weekly_ends):
+                s = int((week + timedelta(seconds=start)).timestamp())
+                e = int((week + timedelta(seconds=end)).timestamp())
+                if e > ts and s < ts + horizon:
+                    spans.append((s, e))
+            week += timedelta(days=7)
+        return list(zip(*_merge(spans)))
+
+
+# group -> calendar, '' for fleet-wide blackouts, redefined by plugins on reload
+calendars: dict[str, Calendar] = {}
+
+
+def blackout(*specs: str, group: str = '') -> None:
+    """Hold new starts of all tasks, or tasks of group, during specs
+
+    'Sat 00:00-06:00', 'mon-fri 22:00-02:00', '03:00-04:00' recur weekly
+    or daily in local time, '2026-12-24', '2026-12-24 - 2026-12-26' or
+    '2026-12-24 18:00 - 2026-12-25 06:00' are absolute.
+    """
+    calendar = calendars.setdefault(group, Calendar())
+    for spec in specs:
+        try:
+            calendar.add(spec)
+        except ValueError:
+            log.error(f'invalid blackout {repr(spec)}')
+            raise
+    log.info(f'blackout {group or "(all)"}: {calendar.specs}')
+
+
+def open_at(group: str, ts: int) -> int:
+    """First time from ts outside blackouts of all tasks and of group"""
+    active = [calendars[x] for x in dict.fromkeys(['', group]) if x in calendars]
+    for _ in range(1000):  # windows chained across calendars
+        ends = [x for x in (c.blocked_until(ts) for c in active) if x]
+        if not ends:
+            return ts
+        ts = max(ends)
+    log.error(f'no open window found for group {repr(group)}')
+    return ts